@@ -0,0 +1,408 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+端到端基准测试：生成合成的 pp.x / HDF5 数据，逐个运行主要流程，
+记录耗时和子进程峰值内存 (peak RSS)，结果写为 JSON，可与基线比较。
+
+用法:
+    python benchmark.py                                  # 默认规模运行全部基准
+    python benchmark.py --grid 64 64 64 --steps 20       # 指定网格大小和步数
+    python benchmark.py --only gather density2db         # 只运行部分基准
+    python benchmark.py -o new.json --baseline old.json  # 与基线比较
+    python benchmark.py --generate-only data/            # 只生成测试数据
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ---------------------------------------------------------------------------
+# 合成数据生成
+# ---------------------------------------------------------------------------
+
+def synthetic_density(grid, step=0, seed=0):
+    """
+    生成一个周期性网格上的合成电荷密度：若干高斯峰 + 少量噪声，
+    峰的位置随 step 缓慢漂移，模拟 MD 轨迹中相邻步之间的小变化。
+    """
+    rng = np.random.default_rng(seed)
+    nx, ny, nz = grid
+    x, y, z = np.meshgrid(
+        np.arange(nx) / nx, np.arange(ny) / ny, np.arange(nz) / nz, indexing="ij"
+    )
+    density = np.zeros(grid)
+    for _ in range(4):
+        center = rng.random(3)
+        velocity = rng.normal(scale=1e-3, size=3)
+        width = rng.uniform(0.05, 0.15)
+        c = (center + velocity * step) % 1.0
+        # 最小镜像距离，保证周期性
+        d2 = sum(np.minimum(abs(r - ci), 1 - abs(r - ci)) ** 2 for r, ci in zip((x, y, z), c))
+        density += rng.uniform(0.5, 2.0) * np.exp(-d2 / (2 * width ** 2))
+    noise = np.random.default_rng(seed * 100003 + step).normal(scale=1e-4, size=grid)
+    return density + noise
+
+def write_ppfile(filename, grid, step=0, alat=10.0, seed=0):
+    """按 pp.x 的 filplot 格式 (ibrav=0) 写出 chargedensity.txt"""
+    nx, ny, nz = grid
+    density = synthetic_density(grid, step, seed)
+    with open(filename, "w") as f:
+        f.write("\n")
+        f.write("".join(f"{n:8d}" for n in (nx, ny, nz, nx, ny, nz, 2, 1)) + "\n")
+        f.write(f"{0:6d}" + "".join(f"{v:12.8f}" for v in (alat, 0, 0, 0, 0, 0)) + "\n")
+        for row in np.eye(3):
+            f.write("".join(f"{v:20.10f}" for v in row) + "\n")
+        f.write("".join(f"{v:20.10f}" for v in (100.0, 4.0, 25.0)) + f"{0:6d}\n")
+        f.write(f"{1:4d}   {'O':2s}   {6.0:5.2f}\n")
+        for na, tau in enumerate(((0.0, 0.0, 0.0), (0.5, 0.5, 0.5)), 1):
+            f.write(f"{na:4d}   " + "".join(f"{v:15.9f}" for v in tau) + f"   {1:4d}\n")
+        # pp.x 按 Fortran 顺序（x 变化最快）每行写 5 个数
+        values = density.ravel(order="F")
+        nfull = values.size // 5 * 5
+        np.savetxt(f, values[:nfull].reshape(-1, 5), fmt="%17.9E", delimiter="")
+        if nfull < values.size:
+            np.savetxt(f, values[nfull:].reshape(1, -1), fmt="%17.9E", delimiter="")
+
+def write_density_hdf5(filename, grid, step=0, alat=10.0, seed=0, key="plot"):
+    """直接用 h5py 写出与 ppfile2hdf5 输出结构相同的密度 HDF5 文件"""
+    import h5py
+    bohr2ang = 0.529177249
+    with h5py.File(filename, "w") as f:
+        g = f.create_group("grid")
+        for name, n in zip(("nr1x", "nr2x", "nr3x"), grid):
+            g[name] = n
+        f["lattice_matrix"] = np.eye(3) * alat * bohr2ang
+        f[key] = synthetic_density(grid, step, seed)
+
+def make_step_dirs(root, grid, startstep, dstep, endstep, fmt="txt", seed=0):
+    """按 ppfile2gather 的约定生成 <N>/chargedensity.txt（或 .hdf5）"""
+    for N in range(startstep, endstep + 1, dstep):
+        stepdir = os.path.join(root, str(N))
+        os.makedirs(stepdir, exist_ok=True)
+        if fmt == "hdf5":
+            write_density_hdf5(os.path.join(stepdir, "chargedensity.hdf5"), grid, N, seed=seed)
+        else:
+            write_ppfile(os.path.join(stepdir, "chargedensity.txt"), grid, N, seed=seed)
+
+def write_random_file(filename, size, chunk_size=1 << 24):
+    """写出指定大小的随机二进制文件，用于哈希和传输测试"""
+    rng = np.random.default_rng(0)
+    with open(filename, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            n = min(chunk_size, remaining)
+            f.write(rng.integers(0, 256, n, dtype=np.uint8).tobytes())
+            remaining -= n
+
+def generate_inputs(workdir, grid, nstep, file_size):
+    """生成全部基准所需的输入数据，返回各文件路径"""
+    os.makedirs(workdir, exist_ok=True)
+    paths = {
+        "ppfile": os.path.join(workdir, "chargedensity.txt"),
+        "stepdir": os.path.join(workdir, "steps"),
+        "densities": [os.path.join(workdir, f"density.{i}.hdf5") for i in range(nstep)],
+        "blob": os.path.join(workdir, "blob.bin"),
+    }
+    write_ppfile(paths["ppfile"], grid)
+    make_step_dirs(paths["stepdir"], grid, 1, 1, nstep)
+    for i, filename in enumerate(paths["densities"]):
+        write_density_hdf5(filename, grid, i, key="density")
+    write_random_file(paths["blob"], file_size)
+    return paths
+
+# ---------------------------------------------------------------------------
+# 计时与峰值内存
+# ---------------------------------------------------------------------------
+
+# 轻量的中间进程：fork+exec 待测命令并记录其 rusage。
+# 直接从本进程 fork 时，子进程的 ru_maxrss 会包含 exec 之前复制的父进程内存（numpy 等），
+# 通过这个只导入 os/sys 的中间进程 fork 可以避免高估。
+_RUSAGE_WRAPPER = """
+import os, sys
+pid = os.fork()
+if pid == 0:
+    os.execvp(sys.argv[2], sys.argv[2:])
+_, status, rusage = os.wait4(pid, 0)
+with open(sys.argv[1], "w") as f:
+    f.write(str(rusage.ru_maxrss))
+sys.exit(os.waitstatus_to_exitcode(status))
+"""
+
+def _maxrss_mb(maxrss):
+    # Linux 下 ru_maxrss 单位为 KB，macOS 下为字节
+    scale = 1 if sys.platform == "darwin" else 1024
+    return maxrss * scale / 1024 ** 2
+
+def run_measured(command, cwd=None):
+    """运行子进程，返回 (耗时秒, 峰值 RSS MB, 返回码, 输出尾部)"""
+    with tempfile.NamedTemporaryFile("r", suffix=".maxrss") as rss_file:
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-c", _RUSAGE_WRAPPER, rss_file.name] + command,
+            cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        )
+        elapsed = time.perf_counter() - start
+        maxrss = rss_file.read().strip()
+    tail = proc.stdout.decode("utf-8", "replace").strip().splitlines()[-3:]
+    return elapsed, _maxrss_mb(int(maxrss or 0)), proc.returncode, tail
+
+def script(name):
+    return [sys.executable, os.path.join(SCRIPT_DIR, name)]
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"httpserver 未在 {timeout} 秒内监听端口 {port}")
+
+# ---------------------------------------------------------------------------
+# 基准定义：每个基准返回待测命令及其工作目录，setup/teardown 不计时
+# ---------------------------------------------------------------------------
+
+def bench_text2hdf5(paths, outdir, nstep):
+    return script("ppfile2hdf5.py") + [paths["ppfile"], os.path.join(outdir, "chargedensity.hdf5")], outdir
+
+def bench_gather(paths, outdir, nstep):
+    # ppfile2gather 从当前目录读取 <N>/ 并把结果写到当前目录，
+    # 因此在 outdir 中链接各步目录，输出随 outdir 一起清理
+    for name in os.listdir(paths["stepdir"]):
+        os.symlink(os.path.join(paths["stepdir"], name), os.path.join(outdir, name))
+    return script("ppfile2gather.py") + ["1", "1", str(nstep)], outdir
+
+def bench_density2db(paths, outdir, nstep):
+    return script("hdf5density2db.py") + [os.path.join(outdir, "densityDB.hdf5")] + paths["densities"], outdir
+
+def bench_dipole(paths, outdir, nstep):
+    return script("ppfile2dipole.py") + [paths["ppfile"]], outdir
+
+def bench_compress(paths, outdir, nstep):
+    return script("compress_hdf5.py") + [paths["densities"][0], os.path.join(outdir, "compressed.hdf5"), "4"], outdir
+
+def bench_hash(paths, outdir, nstep):
+    return script("pymd5.py") + [paths["blob"]], outdir
+
+def bench_transfer(paths, outdir, nstep):
+    # httpserver 在 setup 中启动，这里只计 pywget 下载
+    url = f"http://127.0.0.1:{paths['port']}/{os.path.basename(paths['blob'])}"
+    return script("pywget.py") + [url, "-o", os.path.join(outdir, "download.bin")], outdir
+
+# 运行后检查输出，返回错误信息或 None；部分工具（如 pywget）出错时仍以 0 退出
+def _expect_file(name, size=None):
+    def check(paths, outdir, nstep):
+        filename = os.path.join(outdir, name.format(nstep=nstep))
+        if not os.path.isfile(filename):
+            return f"missing output {os.path.basename(filename)}"
+        expected = os.path.getsize(paths[size]) if size else None
+        if expected is not None and os.path.getsize(filename) != expected:
+            return f"{os.path.basename(filename)} has {os.path.getsize(filename)} bytes, expected {expected}"
+        return None
+    return check
+
+CHECKS = {
+    "text2hdf5": _expect_file("chargedensity.hdf5"),
+    "gather": _expect_file("chargedensity.1_1_{nstep}.hdf5"),
+    "density2db": _expect_file("densityDB.hdf5"),
+    "compress": _expect_file("compressed.hdf5"),
+    "transfer": _expect_file("download.bin", size="blob"),
+}
+
+BENCHMARKS = {
+    "text2hdf5": bench_text2hdf5,
+    "gather": bench_gather,
+    "density2db": bench_density2db,
+    "dipole": bench_dipole,
+    "compress": bench_compress,
+    "hash": bench_hash,
+    "transfer": bench_transfer,
+}
+
+def run_benchmarks(paths, names, nstep, repeat):
+    results = {}
+    server = None
+    if "transfer" in names:
+        paths["port"] = _free_port()
+        server = subprocess.Popen(
+            script("httpserver.py") + ["-p", str(paths["port"])],
+            cwd=os.path.dirname(paths["blob"]),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        _wait_port(paths["port"])
+    try:
+        for name in names:
+            times, rss = [], []
+            for _ in range(repeat):
+                outdir = tempfile.mkdtemp(prefix=f"{name}.", dir=os.path.dirname(paths["blob"]))
+                command, cwd = BENCHMARKS[name](paths, outdir, nstep)
+                elapsed, peak, returncode, tail = run_measured(command, cwd)
+                error = f"exit code {returncode}" if returncode != 0 else None
+                if error is None and name in CHECKS:
+                    error = CHECKS[name](paths, outdir, nstep)
+                shutil.rmtree(outdir, ignore_errors=True)
+                if error:
+                    results[name] = {"error": error, "output": tail}
+                    break
+                times.append(elapsed)
+                rss.append(peak)
+            else:
+                results[name] = {
+                    "wall_s_min": min(times),
+                    "wall_s_median": statistics.median(times),
+                    "peak_rss_mb": max(rss),
+                    "repeat": repeat,
+                }
+            print(f"{name:<12} {format_result(results[name])}", flush=True)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return results
+
+def benchmark_layouts(workdir, grid, nstep, repeat, dtype="float64", nvoxel=64):
+    """
+    对每种 h5layout 布局写出同一个 4D 密度数组，分别计时两种访问模式：
+    snapshot   逐步读取整个网格；
+    timeseries 读取 nvoxel 个随机格点的完整时间序列。
+    在本进程内计时，不记录峰值内存，改为记录文件大小。
+    """
+    from h5layout import LAYOUTS, write_density, open_density
+    data = np.stack([synthetic_density(grid, step) for step in range(nstep)], axis=-1)
+    voxels = np.random.default_rng(0).integers(0, grid, size=(nvoxel, 3))
+    patterns = {
+        "snapshot": lambda dset: [dset[..., i] for i in range(nstep)],
+        "timeseries": lambda dset: [dset[x, y, z, :] for x, y, z in voxels],
+    }
+    results = {}
+    for layout in LAYOUTS:
+        filename = os.path.join(workdir, f"layout.{layout}.hdf5")
+        write_density(filename, "density", data, layout=layout, dtype=dtype)
+        for pattern, read in patterns.items():
+            times = []
+            for _ in range(repeat):
+                f, dset = open_density(filename, "density", access=pattern)
+                start = time.perf_counter()
+                read(dset)
+                times.append(time.perf_counter() - start)
+                f.close()
+            name = f"layout.{layout}.{pattern}"
+            results[name] = {
+                "wall_s_min": min(times),
+                "wall_s_median": statistics.median(times),
+                "file_mb": os.path.getsize(filename) / 1024 ** 2,
+                "chunks": list(h5py_chunks(filename)),
+                "dtype": dtype,
+                "repeat": repeat,
+            }
+            print(f"{name:<32} {format_result(results[name])}", flush=True)
+    return results
+
+def h5py_chunks(filename, key="density"):
+    import h5py
+    with h5py.File(filename, "r") as f:
+        return f[key].chunks
+
+def format_result(result):
+    if "error" in result:
+        return f"ERROR ({result['error']}): {' | '.join(result['output'])}"
+    if "peak_rss_mb" not in result:
+        return f"{result['wall_s_min']:9.3f} s (median {result['wall_s_median']:.3f} s)  file {result['file_mb']:9.1f} MB"
+    return f"{result['wall_s_min']:9.3f} s (median {result['wall_s_median']:.3f} s)  {result['peak_rss_mb']:9.1f} MB"
+
+def compare(results, baseline, threshold):
+    """与基线逐项比较，返回变慢或内存增长超过 threshold 倍的基准名"""
+    regressions = []
+    print(f"\n{'benchmark':<32} {'time ratio':>12} {'rss ratio':>12}")
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or "error" in base or "error" in result:
+            continue
+        time_ratio = result["wall_s_min"] / base["wall_s_min"]
+        # 进程内的布局基准没有峰值内存
+        rss_ratio = result["peak_rss_mb"] / base["peak_rss_mb"] if "peak_rss_mb" in result else float("nan")
+        flag = ""
+        if time_ratio > threshold or rss_ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<32} {time_ratio:>12.2f} {rss_ratio:>12.2f}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks with synthetic pp.x and HDF5 data")
+    parser.add_argument("--grid", type=int, nargs=3, default=[48, 48, 48], help="Density grid size (default is 48 48 48)")
+    parser.add_argument("--steps", type=int, default=10, help="Number of MD steps to generate (default is 10)")
+    parser.add_argument("--file-size", type=int, default=256, help="Size in MB of the file used for hash/transfer (default is 256)")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per benchmark (default is 3)")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Run only these benchmarks")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="JSON file to write results to (default is benchmark.json)")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Ratio above which a benchmark counts as a regression (default is 1.2)")
+    parser.add_argument("--layouts", action="store_true", help="Also benchmark snapshot/time-series reads for each chunk layout")
+    parser.add_argument("--dtype", choices=["float64", "float32"], default="float64", help="Precision used by the layout benchmarks (default is float64)")
+    parser.add_argument("--workdir", help="Directory for generated data (default is a temporary directory)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated data")
+    parser.add_argument("--generate-only", metavar="DIR", help="Only generate the synthetic inputs into DIR")
+    args = parser.parse_args()
+
+    grid = tuple(args.grid)
+    file_size = args.file_size * 1024 ** 2
+    if args.generate_only:
+        generate_inputs(args.generate_only, grid, args.steps, file_size)
+        print(f"Synthetic inputs written to {args.generate_only}")
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="qkit-bench.")
+    try:
+        print(f"Generating inputs in {workdir} ...", flush=True)
+        paths = generate_inputs(workdir, grid, args.steps, file_size)
+        names = args.only or list(BENCHMARKS)
+        results = run_benchmarks(paths, names, args.steps, args.repeat)
+        if args.layouts:
+            results.update(benchmark_layouts(workdir, grid, args.steps, args.repeat, args.dtype))
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "grid": list(grid),
+            "steps": args.steps,
+            "file_size_mb": args.file_size,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
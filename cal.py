@@ -7,24 +7,243 @@
 # Build  : 2021-01-24            #
 # What   : 简单计算 #
 ##################################
+
+用法:
+    cal.py 1+2                          # 单次计算
+    cal.py -e "x*2+sin(y)" [file]       # 表达式只编译一次，按列向量化计算 stdin/文件
+    cal.py -i                           # 交互/管道模式，每行一个表达式
 """
 
 import sys
 import os
-import numpy as np
+import ast
+import argparse
+import itertools
+import functools
 from math import *
 
+# 向量化计算时允许使用的函数与常量（全部映射到 numpy，可直接作用于整列数组）
+_NUMPY_NAMES = [
+    "sin", "cos", "tan", "arcsin", "arccos", "arctan", "arctan2",
+    "sinh", "cosh", "tanh", "arcsinh", "arccosh", "arctanh",
+    "exp", "expm1", "log", "log2", "log10", "log1p", "sqrt", "cbrt",
+    "abs", "fabs", "floor", "ceil", "trunc", "round", "sign", "hypot",
+    "degrees", "radians", "deg2rad", "rad2deg", "minimum", "maximum",
+    "where", "clip", "mod", "power", "pi", "e", "inf", "nan",
+]
+# math 风格的别名
+_MATH_ALIASES = {
+    "asin": "arcsin", "acos": "arccos", "atan": "arctan", "atan2": "arctan2",
+    "asinh": "arcsinh", "acosh": "arccosh", "atanh": "arctanh", "pow": "power",
+}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.Expr, ast.Module, ast.Assign, ast.Store,
+    ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp,
+    ast.Call, ast.Name, ast.Load, ast.Constant, ast.Attribute, ast.Tuple,
+    ast.operator, ast.unaryop, ast.boolop, ast.cmpop,
+)
+_MODULE_NAMES = ("np", "numpy")
+# 沿整列归约/累积的函数：结果依赖整列数据，按块计算时会随 --block 改变，只在交互模式中允许
+_REDUCTIONS = {"sum", "mean", "std", "var", "min", "max", "prod", "cumsum", "cumprod", "median"}
+# 除 ufunc 外允许通过 np.<name> 访问的名字（不含任何文件读写接口）
+_NUMPY_ATTRS = set(_NUMPY_NAMES) | _REDUCTIONS | {
+    "ones_like", "zeros_like", "full_like", "isnan", "isinf", "isfinite",
+}
+
+
+# 不导入 numpy 即可判断的已知名字
+_KNOWN_NAMES = set(_NUMPY_NAMES) | set(_MATH_ALIASES) | set(_MODULE_NAMES)
+
+
+@functools.lru_cache(maxsize=None)
+def _namespace():
+    """构造安全的求值命名空间（不含任何 builtins），首次使用时才导入 numpy"""
+    import numpy as np
+    namespace = {name: getattr(np, name) for name in _NUMPY_NAMES}
+    namespace.update({alias: getattr(np, name) for alias, name in _MATH_ALIASES.items()})
+    namespace.update({name: np for name in _MODULE_NAMES})
+    return namespace
+
+
+def _check_tree(tree, elementwise=False):
+    """
+    检查语法树，只允许算术、比较、函数调用等安全子集。
+
+    elementwise=True 时还禁止 _REDUCTIONS，保证每行的结果只依赖该行。
+    """
+    import numpy as np
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"不支持的语法: {type(node).__name__}")
+        if isinstance(node, ast.Attribute):
+            # 只允许 np.xxx / numpy.xxx，且只能访问白名单中的名字和 ufunc
+            if not (isinstance(node.value, ast.Name) and node.value.id in _MODULE_NAMES):
+                raise ValueError("只允许访问 np.<name> 形式的属性")
+            if node.attr not in _NUMPY_ATTRS and not isinstance(getattr(np, node.attr, None), np.ufunc):
+                raise ValueError(f"不允许访问 np.{node.attr}")
+            if elementwise and node.attr in _REDUCTIONS:
+                raise ValueError(f"按行计算时不能使用归约函数 np.{node.attr}，请使用 -i 交互模式")
+        elif isinstance(node, ast.Name) and node.id.startswith("_"):
+            raise ValueError(f"不允许使用以下划线开头的名字: {node.id}")
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, (ast.Name, ast.Attribute)):
+                raise ValueError("只允许直接调用函数")
+            if isinstance(node.func, ast.Name) and node.func.id not in _KNOWN_NAMES:
+                raise ValueError(f"不支持的函数: {node.func.id}")
+        elif isinstance(node, ast.Assign):
+            if len(node.targets) != 1 or not isinstance(node.targets[0], ast.Name):
+                raise ValueError("只支持 name = expr 形式的赋值")
+
+
+def _free_variables(tree):
+    """返回表达式中的自由变量（按字母顺序，x、y、z 依次对应第 0、1、2 列）"""
+    return sorted({node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and node.id not in _KNOWN_NAMES})
+
+
+def compile_expr(expr, elementwise=False):
+    """
+    将表达式编译一次，供后续反复求值。
+
+    :param expr: 表达式字符串，只能使用算术/比较运算和 numpy/math 函数。
+    :param elementwise: 为 True 时禁止 sum、mean、cumsum 等跨行的归约函数。
+    :return: (code, variables)，variables 为按字母顺序排列的自由变量名。
+    """
+    tree = ast.parse(expr.strip(), mode="eval")
+    _check_tree(tree, elementwise)
+    return compile(tree, "<expr>", "eval"), _free_variables(tree)
+
+
+def evaluate(code, variables=None):
+    """在安全命名空间中对已编译的表达式求值，变量可以是标量或 numpy 数组"""
+    scope = dict(_namespace())
+    if variables:
+        scope.update(variables)
+    return eval(code, {"__builtins__": {}}, scope)
+
+
+def read_blocks(stream, block_size=65536):
+    """按块读取数值列，每次返回形状为 (nrow, ncol) 的数组；跳过空行和 # 注释行"""
+    import numpy as np
+    lines = (line for line in stream if line.strip() and not line.lstrip().startswith("#"))
+    while True:
+        block = list(itertools.islice(lines, block_size))
+        if not block:
+            break
+        yield np.loadtxt(block, ndmin=2)
+
+
+def evaluate_stream(expr, stream, out=sys.stdout, names=None, block_size=65536, fmt="%.10g"):
+    """
+    对输入流中的每一行求值，表达式只编译一次，每块数据整体向量化计算。
+    每行的结果只能依赖该行，因此不允许 sum、mean、cumsum 等归约函数，输出与 block_size 无关。
+
+    :param expr: 表达式字符串。
+    :param stream: 输入流，每行若干列数值。
+    :param out: 输出流。
+    :param names: 各列对应的变量名，默认按自由变量的字母顺序依次绑定第 0、1、... 列。
+    :param block_size: 每块读取的行数。
+    :param fmt: 输出格式。
+    """
+    import numpy as np
+    code, free = compile_expr(expr, elementwise=True)
+    names = list(names) if names else free
+    missing = [name for name in free if name not in names]
+    if missing:
+        raise ValueError(f"变量 {', '.join(missing)} 没有对应的输入列")
+
+    for block in read_blocks(stream, block_size):
+        if block.shape[1] < len(names):
+            raise ValueError(f"输入只有 {block.shape[1]} 列，但需要 {len(names)} 列: {' '.join(names)}")
+        columns = {name: block[:, i] for i, name in enumerate(names)}
+        result = np.asarray(evaluate(code, columns))
+        if result.shape not in ((), (block.shape[0],)):
+            raise ValueError(f"表达式结果的形状为 {result.shape}，应为标量或每行一个值")
+        result = np.broadcast_to(result, (block.shape[0],))
+        np.savetxt(out, result, fmt=fmt)
+
+
+def repl(stream=sys.stdin, out=sys.stdout):
+    """交互/管道模式：进程常驻，每行一个表达式或 name = expr 赋值"""
+    interactive = stream.isatty()
+    scope = {}
+    while True:
+        if interactive:
+            out.write(">>> ")
+            out.flush()
+        line = stream.readline()
+        if not line:
+            break
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            tree = ast.parse(line, mode="exec")
+            _check_tree(tree)
+            if len(tree.body) != 1:
+                raise ValueError("每行只能有一个表达式")
+            stmt = tree.body[0]
+            if isinstance(stmt, ast.Assign):
+                code = compile(ast.Expression(stmt.value), "<expr>", "eval")
+                scope[stmt.targets[0].id] = evaluate(code, scope)
+                continue
+            code = compile(ast.Expression(stmt.value), "<expr>", "eval")
+            value = evaluate(code, scope)
+        except Exception as e:
+            print(f"错误: {e}", file=out)
+            continue
+        print(value, file=out)
+        out.flush()
+
+
+_STREAM_OPTIONS = ("-e", "--expr", "--vars", "--block", "--fmt", "-h", "--help")
+
+
+def stream_main(argv):
+    parser = argparse.ArgumentParser(description="表达式只编译一次，按列向量化计算 stdin/文件中的数据")
+    parser.add_argument("-e", "--expr", required=True, help="表达式，例如 'x*2+sin(y)'")
+    parser.add_argument("file", nargs="?", default="-", help="输入文件，默认为 stdin")
+    parser.add_argument("--vars", nargs="+", help="各列对应的变量名，默认按变量名的字母顺序")
+    parser.add_argument("--block", type=int, default=65536, help="每块读取的行数（默认为 65536）")
+    parser.add_argument("--fmt", default="%.10g", help="输出格式（默认为 %%.10g）")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.file == "-":
+            evaluate_stream(args.expr, sys.stdin, names=args.vars, block_size=args.block, fmt=args.fmt)
+        else:
+            with open(args.file) as f:
+                evaluate_stream(args.expr, f, names=args.vars, block_size=args.block, fmt=args.fmt)
+    except (ValueError, SyntaxError) as e:
+        parser.error(str(e))
+
+
 def main():
     #-----Input File
     if len(sys.argv) == 1:
         print( "Usage: "+str(sys.argv[0])+" 1+2")
-        exit
+        print( "       "+str(sys.argv[0])+" -e 'x*2+y' [file]")
+        print( "       "+str(sys.argv[0])+" -i")
+        return
+
+    if sys.argv[1] in ("-i", "--repl"):
+        repl()
+        return
+    # 以 stream_main 的选项开头（含 --expr=... 形式）时进入向量化模式，否则按旧方式求值（如 cal.py -1+2）
+    if sys.argv[1].split("=", 1)[0] in _STREAM_OPTIONS:
+        stream_main(sys.argv[1:])
+        return
 
     print("{:10s}".format("expr")+" \t = ","value")
     expr=""
     for i in sys.argv[1:]:
         expr=expr+str(i)
-    print("{:10s}".format(expr)+" \t = ",eval(expr))
+    scope = {}
+    if any(name in expr for name in _MODULE_NAMES):
+        # 只有表达式用到 np./numpy. 时才导入，保证简单计算的启动速度
+        import numpy as np
+        scope.update({name: np for name in _MODULE_NAMES})
+    print("{:10s}".format(expr)+" \t = ",eval(expr, globals(), scope))
 
 
 if __name__ == "__main__":
@@ -13,8 +13,11 @@ def compress_hdf5(input_file: str, output_file: str, compression_level: int):
     """
     def copy_dataset(input_group, output_group):
         """
-        递归复制数据集，应用压缩。
+        递归复制数据集及其属性，应用压缩。
+
+        属性需要一并复制：h5delta 等格式的元数据（编码、形状、关键帧间隔等）全部保存在属性中。
         """
+        output_group.attrs.update(input_group.attrs)
         for name, item in input_group.items():
             if isinstance(item, h5py.Group):
                 # 如果是组，递归复制
@@ -33,6 +36,7 @@ def compress_hdf5(input_file: str, output_file: str, compression_level: int):
                 else:
                     # 对于标量数据集，直接保存
                     output_group.create_dataset(name, data=data)
+                output_group[name].attrs.update(item.attrs)
             else:
                 print(f"Skipping unknown item type: {name}")
 
@@ -0,0 +1,308 @@
+import argparse
+import itertools
+import math
+import multiprocessing
+import h5py
+import numpy as np
+from h5layout import open_density
+from h5delta import is_delta, DeltaReader
+
+AXES = {"x": 0, "y": 1, "z": 2}
+
+class StepSource:
+    """
+    按步范围读取 ppfile2gather/hdf5density2db 输出中的 4D 密度 (nx, ny, nz, nstep)。
+
+    支持普通数据集和 h5delta 的关键帧 + 增量格式，block 为一次读取的自然步数
+    （步方向的块大小或关键帧间隔），chunks 为普通分块数据集的分块形状。
+    analyze 按分块对齐读取（步方向按 block，放不下时再按空间分块切开），每个分块只读一次，
+    因此保持 HDF5 默认的 chunk cache，不为每个工作进程额外分配。
+    """
+
+    def __init__(self, filename, key=None):
+        self.file = h5py.File(filename, "r")
+        if key is None:
+            key = next((k for k in ("density", "densityDB") if k in self.file), None)
+            if key is None:
+                self.file.close()
+                raise KeyError(f"{filename} 中没有 density 或 densityDB")
+        self.lattice = self.file["lattice_matrix"][()] if "lattice_matrix" in self.file else None
+        self.steps = self._steps()
+
+        if is_delta(self.file[key]):
+            self.reader = DeltaReader(self.file[key])
+            self.shape = self.reader.shape
+            self.block = self.reader.keyframe_interval
+            self.chunks = None
+        elif isinstance(self.file[key], h5py.Group):
+            # 例如属性丢失的 h5delta 组：没有编码信息就无法重建
+            self.file.close()
+            raise ValueError(f"{filename} 中的 {key} 是组而不是数据集，且不是 h5delta 编码的数据（属性可能已丢失）")
+        else:
+            self.file.close()
+            self.file, dataset = open_density(filename, key)
+            self.reader = dataset
+            self.shape = dataset.shape
+            self.block = dataset.chunks[-1] if dataset.chunks else 1
+            self.chunks = dataset.chunks
+        self.key = key
+
+    def _steps(self):
+        """ppfile2gather 记录的 MD 步号，没有时返回 None"""
+        if all(k in self.file for k in ("startstep", "dstep", "endstep")):
+            start, dstep, end = (int(self.file[k][()]) for k in ("startstep", "dstep", "endstep"))
+            return np.arange(start, end + 1, dstep)
+        return None
+
+    def read(self, start, stop, tile=None):
+        """读取第 [start, stop) 步，tile 为空间范围 (x 切片, y 切片, z 切片)，默认为整个网格"""
+        if isinstance(self.reader, DeltaReader):
+            data = self.reader.read(start, stop)
+            return data[tile] if tile is not None else data
+        return self.reader[(tile or (Ellipsis,)) + (slice(start, stop),)]
+
+    def close(self):
+        self.file.close()
+
+def macroscopic_average(planar, window):
+    """
+    沿最后一维对平面平均做宽度为 window 个格点的周期性滑动平均（宏观平均）。
+
+    :param planar: 形状为 (nstep, n) 的平面平均。
+    :param window: 滑动窗口宽度（格点数）。
+    """
+    n = planar.shape[-1]
+    window = int(min(max(window, 1), n))
+    kernel = np.zeros(n)
+    kernel[:window] = 1.0 / window
+    kernel = np.roll(kernel, -(window // 2))
+    return np.fft.irfft(np.fft.rfft(planar, axis=-1) * np.fft.rfft(kernel), n=n, axis=-1)
+
+def region_slices(region, grid):
+    """分数坐标区域 (x0, x1, y0, y1, z0, z1) 转换为格点切片，取 x0 <= i/n < x1 的格点"""
+    bounds = np.asarray(region, dtype=float).reshape(3, 2)
+    return tuple(
+        slice(int(np.ceil(lo * n)), int(np.ceil(hi * n)))
+        for (lo, hi), n in zip(bounds, grid)
+    )
+
+def _intersect(region, tile):
+    """区域与空间块的交集，以相对空间块起点的切片表示；不相交时返回 None"""
+    local = []
+    for r, t in zip(region, tile):
+        lo, hi = max(r.start, t.start), min(r.stop, t.stop)
+        if lo >= hi:
+            return None
+        local.append(slice(lo - t.start, hi - t.start))
+    return tuple(local)
+
+def block_sums(data, tile, grid, axes, regions, integrals):
+    """
+    一个空间块 data (tile 内的 nx', ny', nz', nb) 对各归约的贡献：平面和、总和与区域和。
+
+    这些归约都是可分离的求和，各空间块的结果相加即为整个网格的结果，见 finish_sums。
+    平面和为 (nb, n) 数组，空间块以外的格点为 0。
+    """
+    nb = data.shape[-1]
+    sums = {}
+    for name in axes:
+        axis = AXES[name]
+        other = tuple(a for a in range(3) if a != axis)
+        planar = np.zeros((nb, grid[axis]))
+        planar[:, tile[axis]] = data.sum(axis=other).T
+        sums[f"planar_{name}"] = planar
+    if integrals:
+        sums["total"] = data.sum(axis=(0, 1, 2))
+        if regions:
+            sums["regions"] = np.zeros((nb, len(regions)))
+            for i, region in enumerate(regions):
+                local = _intersect(region, tile)
+                if local is not None:
+                    sums["regions"][:, i] = data[local].sum(axis=(0, 1, 2))
+    return sums
+
+def finish_sums(sums, grid, axes, dV, regions, windows):
+    """由全部空间块累加的 block_sums 得到 {数据集名: (nb, ...) 数组}"""
+    result = {}
+    for name in axes:
+        planar = sums[f"planar_{name}"] / (math.prod(grid) // grid[AXES[name]])
+        result[f"planar_{name}"] = planar
+        if name in windows:
+            result[f"macro_{name}"] = macroscopic_average(planar, windows[name])
+    if dV is not None:
+        result["total"] = sums["total"] * dV
+        if regions:
+            result["regions"] = sums["regions"] * dV
+    return result
+
+def analyze_block(data, axes, dV, regions, windows):
+    """
+    对一块步 (nx, ny, nz, nb) 做全部归约，返回 {数据集名: (nb, ...) 数组}。
+
+    :param axes: 需要平面平均的轴名列表。
+    :param dV: 单个格点的体积，为 None 时不计算积分。
+    :param regions: region_slices 得到的切片列表。
+    :param windows: {轴名: 宏观平均窗口格点数}。
+    """
+    grid = data.shape[:3]
+    tile = tuple(slice(0, n) for n in grid)
+    sums = block_sums(data, tile, grid, axes, regions, dV is not None)
+    return finish_sums(sums, grid, axes, dV, regions, windows)
+
+# 工作进程各自打开一次输入文件
+_source = None
+
+def _init_worker(filename, key):
+    global _source
+    _source = StepSource(filename, key)
+
+def _block_sums(task):
+    start, stop, tile, options = task
+    return start, stop, block_sums(_source.read(start, stop, tile), tile, **options)
+
+def step_ranges(nstep, block, step_bytes, max_bytes):
+    """
+    把步轴切成若干块，每块不超过 max_bytes（至少一步）。
+
+    放得下时取 block 的整数倍，与分块/关键帧对齐；放不下一个 block 时按 max_bytes 截断，
+    不再对齐（普通分块数据集此时改为按 spatial_tiles 读取，不使用这里的结果）。
+    """
+    nfit = max(1, max_bytes // step_bytes)
+    nblock = nfit // block * block if nfit >= block else nfit
+    return [(start, min(start + nblock, nstep)) for start in range(0, nstep, nblock)]
+
+def spatial_tiles(grid, chunks, nstep, itemsize, max_bytes):
+    """
+    把网格切成与分块对齐的空间块，每块连同 nstep 步不超过 max_bytes（至少一个分块）。
+
+    依次沿 z、y、x 把空间块扩大为分块的整数倍，每个分块恰好属于一个空间块。
+    """
+    voxels = max(1, max_bytes // (nstep * itemsize))
+    size = list(chunks[:3])
+    for axis in (2, 1, 0):
+        rest = math.prod(size) // size[axis]
+        fit = voxels // rest // chunks[axis] * chunks[axis]
+        size[axis] = min(grid[axis], max(chunks[axis], fit))
+        if size[axis] < grid[axis]:
+            break
+    corners = itertools.product(*(range(0, n, step) for n, step in zip(grid, size)))
+    return [
+        tuple(slice(i, min(i + step, n)) for i, step, n in zip(corner, size, grid))
+        for corner in corners
+    ]
+
+def analyze(input_file, output_file, key=None, axes=("x", "y", "z"), regions=(),
+            macro=None, workers=1, max_memory=512 * 1024 ** 2):
+    """
+    沿步轴逐块读取密度，计算平面平均、宏观平均和区域积分并写入 output_file。
+
+    :param input_file: ppfile2gather/hdf5density2db 输出的 HDF5 文件。
+    :param output_file: 结果 HDF5 文件。
+    :param key: 密度数据名，默认自动查找 density/densityDB。
+    :param axes: 需要平面平均的轴。
+    :param regions: 分数坐标区域列表，每个为 (x0, x1, y0, y1, z0, z1)。
+    :param macro: 宏观平均窗口长度（与 lattice_matrix 相同的长度单位），None 表示不计算。
+    :param workers: 工作进程数。
+    :param max_memory: 每个进程一次读取的密度数据上限（字节），至少读取一步。
+    """
+    source = StepSource(input_file, key)
+    *grid, nstep = source.shape
+    grid = tuple(grid)
+    lattice = source.lattice
+    steps = source.steps
+    key = source.key
+    step_bytes = int(np.prod(grid)) * source.reader.dtype.itemsize
+
+    dV = abs(np.linalg.det(lattice)) / np.prod(grid) if lattice is not None else None
+    slices = [region_slices(region, grid) for region in regions]
+    windows = {}
+    if macro is not None:
+        if lattice is None:
+            raise ValueError("计算宏观平均需要 lattice_matrix")
+        for name in axes:
+            spacing = np.linalg.norm(lattice[AXES[name]]) / grid[AXES[name]]
+            windows[name] = int(round(macro / spacing))
+    finish = dict(grid=grid, axes=list(axes), dV=dV, regions=slices, windows=windows)
+    options = dict(grid=grid, axes=list(axes), regions=slices, integrals=dV is not None)
+
+    itemsize = source.reader.dtype.itemsize
+    if (source.chunks is not None and max(1, max_memory // step_bytes) < source.block
+            and math.prod(source.chunks) * itemsize <= max_memory):
+        # 放不下一个步方向的分块（如 timeseries 布局）：步块仍与分块对齐，
+        # 空间上按分块切开分别读取再累加，每个分块只解压一次。
+        # 单个分块都放不下时只能按 step_ranges 截断，分块会被重复读取
+        ranges = [(start, min(start + source.block, nstep)) for start in range(0, nstep, source.block)]
+        tiles = spatial_tiles(grid, source.chunks, source.block, itemsize, max_memory)
+    else:
+        ranges = step_ranges(nstep, source.block, step_bytes, max_memory)
+        tiles = [tuple(slice(0, n) for n in grid)]
+    tasks = [(start, stop, tile, options) for start, stop in ranges for tile in tiles]
+
+    with h5py.File(output_file, "w") as out:
+        out.attrs["source"] = input_file
+        out.attrs["key"] = key
+        if steps is not None and len(steps) == nstep:
+            out["steps"] = steps
+        if lattice is not None:
+            out["lattice_matrix"] = lattice
+            out["volume"] = abs(np.linalg.det(lattice))
+        if regions:
+            out["region_bounds"] = np.asarray(regions, dtype=float)
+        for name, n in windows.items():
+            out.attrs[f"macro_window_{name}"] = n
+
+        def store(start, stop, result):
+            for name, value in result.items():
+                if name not in out:
+                    out.create_dataset(name, shape=(nstep,) + value.shape[1:], dtype=value.dtype)
+                out[name][start:stop] = value
+
+        # 同一步块的各空间块累加完后再计算平均并写入
+        pending = {}
+
+        def add(start, stop, sums):
+            total, remaining = pending.pop((start, stop), (None, len(tiles)))
+            if total is not None:
+                for name, value in sums.items():
+                    total[name] += value
+            else:
+                total = sums
+            if remaining > 1:
+                pending[start, stop] = (total, remaining - 1)
+            else:
+                store(start, stop, finish_sums(total, **finish))
+
+        if workers > 1:
+            source.close()
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(input_file, key)) as pool:
+                for start, stop, sums in pool.imap(_block_sums, tasks):
+                    add(start, stop, sums)
+        else:
+            for start, stop, tile, _ in tasks:
+                add(start, stop, block_sums(source.read(start, stop, tile), tile, **options))
+            source.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="逐块流式计算密度数据库的平面平均、宏观平均和区域积分")
+    parser.add_argument("input_file", type=str, help="ppfile2gather 或 hdf5density2db 输出的 HDF5 文件")
+    parser.add_argument("output_file", type=str, nargs="?", default="analysis.hdf5", help="结果文件，默认为 'analysis.hdf5'")
+    parser.add_argument("--key", type=str, help="密度数据名，默认自动查找 density/densityDB")
+    parser.add_argument("--axes", nargs="+", choices=list(AXES), default=["x", "y", "z"], help="计算平面平均的轴，默认为 x y z")
+    parser.add_argument(
+        "--region", nargs=6, type=float, action="append", default=[],
+        metavar=("X0", "X1", "Y0", "Y1", "Z0", "Z1"),
+        help="积分区域（分数坐标），可多次指定"
+    )
+    parser.add_argument("--macro", type=float, help="宏观平均窗口长度（与 lattice_matrix 相同单位）")
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数，默认为 1")
+    parser.add_argument("--max-memory", type=int, default=512, help="每个进程一次读取的密度数据上限 (MB)，默认为 512")
+    args = parser.parse_args()
+
+    analyze(
+        args.input_file, args.output_file, key=args.key, axes=args.axes, regions=args.region,
+        macro=args.macro, workers=args.workers, max_memory=args.max_memory * 1024 ** 2,
+    )
+    print(f"分析结果已保存到 {args.output_file}")
+
+if __name__ == "__main__":
+    main()
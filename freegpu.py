@@ -1,38 +1,126 @@
-import torch
 import time
 import os
+import sys
+import fcntl
+import tempfile
+import collections
 from datetime import datetime
 import argparse
-import psutil
 import subprocess  # 用于调用 nvidia-smi 获取显存信息
 
+# count 字段给出 GPU 总数，因此无需再导入 torch 获取设备数量
+QUERY_FIELDS = "count,index,memory.total,memory.used,memory.free"
+
+def nvidia_smi_command(loop_ms=None):
+    """构造 nvidia-smi 命令（直接按 PATH 查找，不经过 shell）"""
+    command = ["nvidia-smi", f"--query-gpu={QUERY_FIELDS}", "--format=csv,noheader,nounits"]
+    if loop_ms:
+        command.append(f"--loop-ms={loop_ms}")
+    return command
+
+def parse_memory_line(line):
+    """
+    解析一行 nvidia-smi 输出，返回 (GPU总数, GPU索引, 显存信息)。
+
+    显存为 [N/A] 等无法解析的值时（如 MIG 或不支持查询的设备），
+    该 GPU 记为不可用 (available=False)，显存按 0 处理；GPU 总数或索引无法解析时抛出 ValueError。
+    """
+    fields = [field.strip() for field in line.split(',')]
+    if len(fields) != 5:
+        raise ValueError(f"无法解析 nvidia-smi 输出: {line}")
+    count, gpu_id = int(fields[0]), int(fields[1])
+    try:
+        total, used, free = map(int, fields[2:])
+        available = True
+    except ValueError:
+        total = used = free = 0
+        available = False
+    return count, gpu_id, {
+        'total': total,
+        'used': used,
+        'free': free,
+        'available': available
+    }
+
 def get_nvidia_smi_memory():
     """调用 nvidia-smi 获取显存信息"""
-    command = "nvidia-smi --query-gpu=index,memory.total,memory.used,memory.free --format=csv,noheader,nounits"
-    result = subprocess.check_output(command, shell=True).decode('utf-8').strip().splitlines()
+    result = subprocess.check_output(nvidia_smi_command()).decode('utf-8').strip().splitlines()
     
     # 返回一个字典，键为GPU索引，值为[total_memory, used_memory, free_memory]
     memory_info = {}
     for line in result:
-        gpu_id, total, used, free = map(int, line.split(', '))
-        memory_info[gpu_id] = {
-            'total': total,
-            'used': used,
-            'free': free
-        }
+        _, gpu_id, info = parse_memory_line(line)
+        memory_info[gpu_id] = info
     return memory_info
 
-def get_best_gpu(start_gpu=0, end_gpu=-1):
+class NvidiaSmiStream:
+    """
+    常驻的 nvidia-smi --loop-ms 子进程，增量解析其输出。
+
+    每次迭代返回一次完整采样的显存信息（格式同 get_nvidia_smi_memory），
+    避免每次刷新都重新启动 shell 和 nvidia-smi。
+    """
+
+    def __init__(self, interval_ms=1000):
+        self.process = subprocess.Popen(
+            nvidia_smi_command(loop_ms=interval_ms),
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+
+    def __iter__(self):
+        memory_info = {}
+        for line in self.process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                count, gpu_id, info = parse_memory_line(line)
+            except ValueError:
+                # 跳过完全无法解析的行（如报错信息）
+                continue
+            # 同一索引再次出现说明进入了下一轮采样，即使上一轮没有收齐也先输出
+            if gpu_id in memory_info:
+                yield memory_info
+                memory_info = {}
+            memory_info[gpu_id] = info
+            # 收齐所有 GPU 的数据后立即输出一次采样
+            if len(memory_info) >= count:
+                yield memory_info
+                memory_info = {}
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process.stdout.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def get_best_gpu(start_gpu=0, end_gpu=-1, memory_info=None):
     """获取最佳的 GPU（基于空闲显存）"""
     free_memory = []
-    memory_info = get_nvidia_smi_memory()  # 获取nvidia-smi的显存信息
-    end_gpu = end_gpu if end_gpu > 0 else torch.cuda.device_count()
+    if memory_info is None:
+        memory_info = get_nvidia_smi_memory()  # 获取nvidia-smi的显存信息
+    end_gpu = end_gpu if end_gpu > 0 else len(memory_info)
 
     output = f"{'GPU':<6} {'Total Memory (GB)':<22} {'Used Memory (GB)':<22} {'Free Memory (GB)':<22}\n"
     output += "="*80 + "\n"
 
     for i in range(start_gpu, end_gpu):
         # 使用 nvidia-smi 获取的显存数据
+        if not memory_info.get(i, {}).get('available', True):
+            output += f"{i:<6} {'N/A':>22} {'N/A':>22} {'N/A':>22}\n"
+            continue
         total = memory_info.get(i, {}).get('total', 0) / 1024  # 转换为 GB
         used = memory_info.get(i, {}).get('used', 0) / 1024
         free = memory_info.get(i, {}).get('free', 0) / 1024
@@ -42,38 +130,306 @@ def get_best_gpu(start_gpu=0, end_gpu=-1):
         free_memory.append((free, i))
 
     free_memory.sort(reverse=True, key=lambda x: x[0])
-    best_gpu = free_memory[0][1]
+    best_gpu = free_memory[0][1] if free_memory else None
 
     return output, best_gpu
 
 def monitor_gpu_memory(start_gpu, end_gpu, flashinterval):
+    import psutil  # 只有监控模式需要，避免拖慢 freegpu run 的启动
+
     previous_output = ""  # 用于存储上一次输出的内容
 
-    while True:
-        # 获取当前时间和显存信息
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        output, best_gpu = get_best_gpu(start_gpu, end_gpu)
+    # 由常驻的 nvidia-smi 按 flashinterval 秒的间隔推送采样
+    with NvidiaSmiStream(interval_ms=flashinterval * 1000) as stream:
+        for memory_info in stream:
+            # 获取当前时间和显存信息
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            output, best_gpu = get_best_gpu(start_gpu, end_gpu, memory_info)
+
+            # 获取CPU内存信息
+            cpu_memory = psutil.virtual_memory()
+            total_cpu_memory = cpu_memory.total / 1024**3  # 转换为GB
+            used_cpu_memory = cpu_memory.used / 1024**3  # 转换为GB
+            free_cpu_memory = cpu_memory.free / 1024**3  # 转换为GB
+
+            # 拼接最终输出
+            final_output = f"Timestamp: {timestamp}\n" + "="*80 + "\n" + output
+            final_output += f"\nBest GPU for allocation: GPU {best_gpu} (based on free memory)\n\n"
+            final_output += f"CPU Memory - Total: {total_cpu_memory:>6.2f} GB, Used: {used_cpu_memory:>6.2f} GB, Free: {free_cpu_memory:>6.2f} GB\n"
+
+            # 判断是否有变化，避免重复刷新
+            if final_output != previous_output:
+                os.system('cls' if os.name == 'nt' else 'clear')  # 清除屏幕，适配Windows
+                print(final_output)
+                previous_output = final_output
+
+# ---------------------------------------------------------------------------
+# freegpu run: 等待空闲显存、租用 GPU 并启动任务
+# ---------------------------------------------------------------------------
+
+# 所有启动器共享的锁/租约目录（同一节点上的不同用户也应使用同一目录）
+DEFAULT_LOCK_DIR = os.environ.get("FREEGPU_LOCK_DIR", os.path.join(tempfile.gettempdir(), "freegpu"))
+
+def parse_memory_size(text):
+    """将 '20G'、'512M'、'20000' 等显存大小转换为 MiB（无单位时按 MiB 处理）"""
+    units = {"K": 1 / 1024, "M": 1, "G": 1024, "T": 1024 ** 2}
+    text = text.strip().upper().rstrip("IB")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+class MemoryHistory:
+    """
+    每块 GPU 最近若干次采样的显存环形缓冲区。
+
+    选卡时按窗口内的峰值占用计算可用显存，避免被瞬时的低占用误导。
+    """
+
+    def __init__(self, window=30):
+        self.window = window
+        self.used = {}
+        self.total = {}
+
+    def update(self, memory_info):
+        for gpu_id, info in memory_info.items():
+            if not info.get('available', True):
+                # 显存无法查询的 GPU 不参与选卡
+                self.total.pop(gpu_id, None)
+                self.used.pop(gpu_id, None)
+                continue
+            self.used.setdefault(gpu_id, collections.deque(maxlen=self.window)).append(info['used'])
+            self.total[gpu_id] = info['total']
+
+    def peak_used(self, gpu_id):
+        return max(self.used.get(gpu_id, [0]))
 
-        # 获取CPU内存信息
-        cpu_memory = psutil.virtual_memory()
-        total_cpu_memory = cpu_memory.total / 1024**3  # 转换为GB
-        used_cpu_memory = cpu_memory.used / 1024**3  # 转换为GB
-        free_cpu_memory = cpu_memory.free / 1024**3  # 转换为GB
+    def effective_free(self, gpu_id):
+        """窗口内最坏情况下的空闲显存 (MiB)"""
+        return self.total.get(gpu_id, 0) - self.peak_used(gpu_id)
 
-        # 拼接最终输出
-        final_output = f"Timestamp: {timestamp}\n" + "="*80 + "\n" + output
-        final_output += f"\nBest GPU for allocation: GPU {best_gpu} (based on free memory)\n\n"
-        final_output += f"CPU Memory - Total: {total_cpu_memory:>6.2f} GB, Used: {used_cpu_memory:>6.2f} GB, Free: {free_cpu_memory:>6.2f} GB\n"
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # 进程存在但属于其他用户
+        return True
+    return True
 
-        # 判断是否有变化，避免重复刷新
-        if final_output != previous_output:
-            os.system('cls' if os.name == 'nt' else 'clear')  # 清除屏幕，适配Windows
-            print(final_output)
-            previous_output = final_output
+def _open_shared(path, flags):
+    """创建所有用户都可读写的文件（忽略 umask）"""
+    fd = os.open(path, flags, 0o666)
+    try:
+        os.fchmod(fd, 0o666)
+    except PermissionError:
+        pass
+    return fd
 
-        time.sleep(flashinterval)  # 每隔flashinterval秒刷新一次显存信息
+class GpuLeases:
+    """
+    基于文件的 GPU 租约与排队。
+
+    lock_dir/.lock      全局锁，选卡与写租约在同一把 flock 下完成
+    lock_dir/queue/     排队的任务，按文件名（时间戳）排序，内容为所需显存和可选 GPU
+    lock_dir/leases/    每个已启动任务一个租约文件，记录 GPU、预留显存和 pid
+
+    任务通过 exec 启动，pid 不变；pid 退出后租约和排队记录自动失效。
+    """
+
+    def __init__(self, lock_dir=DEFAULT_LOCK_DIR, hold=60):
+        self.lock_dir = lock_dir
+        self.queue_dir = os.path.join(lock_dir, "queue")
+        self.lease_dir = os.path.join(lock_dir, "leases")
+        self.hold = hold
+        for path in (self.lock_dir, self.queue_dir, self.lease_dir):
+            os.makedirs(path, exist_ok=True)
+            try:
+                os.chmod(path, 0o1777)
+            except PermissionError:
+                pass
+        self.lock_fd = _open_shared(os.path.join(lock_dir, ".lock"), os.O_RDWR | os.O_CREAT)
+        self.ticket = None
+
+    def __enter__(self):
+        fcntl.flock(self.lock_fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+
+    def _live_entries(self, directory):
+        """列出 pid 仍存活的记录，顺带删除过期记录"""
+        entries = []
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            try:
+                pid = int(name.rsplit(".", 1)[-1])
+            except ValueError:
+                continue
+            if _pid_alive(pid):
+                entries.append(name)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return entries
+
+    def enqueue(self, min_free, gpus=None):
+        """加入队列（需在持有锁时调用），记录所需显存和可选 GPU，返回排队记录名"""
+        self.ticket = f"{time.time_ns():020d}.{os.getpid()}"
+        gpus_text = ",".join(map(str, gpus)) if gpus is not None else "all"
+        fd = _open_shared(os.path.join(self.queue_dir, self.ticket), os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        with os.fdopen(fd, "w") as f:
+            f.write(f"{min_free} {gpus_text}\n")
+        return self.ticket
+
+    def dequeue(self):
+        if self.ticket:
+            try:
+                os.remove(os.path.join(self.queue_dir, self.ticket))
+            except OSError:
+                pass
+            self.ticket = None
+
+    def ahead(self):
+        """排在当前任务前面的任务，按先后顺序返回 [(min_free, gpus), ...]"""
+        jobs = []
+        for name in self._live_entries(self.queue_dir):
+            if name == self.ticket:
+                break
+            try:
+                with open(os.path.join(self.queue_dir, name)) as f:
+                    min_free, gpus_text = f.read().split()[:2]
+                gpus = None if gpus_text == "all" else [int(i) for i in gpus_text.split(",")]
+                jobs.append((int(min_free), gpus))
+            except (OSError, ValueError):
+                continue
+        return jobs
+
+    def reserved(self):
+        """返回 {gpu_id: 预留显存 MiB}，只统计 hold 秒内新启动、尚未体现在 nvidia-smi 读数中的任务"""
+        reserved = {}
+        now = time.time()
+        for name in self._live_entries(self.lease_dir):
+            path = os.path.join(self.lease_dir, name)
+            try:
+                with open(path) as f:
+                    gpu_id, amount = map(int, f.read().split()[:2])
+                if now - os.path.getmtime(path) < self.hold:
+                    reserved[gpu_id] = reserved.get(gpu_id, 0) + amount
+            except (OSError, ValueError):
+                continue
+        return reserved
+
+    def acquire(self, gpu_id, amount):
+        """为当前 pid 写入租约"""
+        path = os.path.join(self.lease_dir, f"gpu{gpu_id}.{os.getpid()}")
+        fd = _open_shared(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        with os.fdopen(fd, "w") as f:
+            f.write(f"{gpu_id} {amount}\n")
+
+def pick_gpu(history, min_free, reserved=None, gpus=None):
+    """在满足 min_free (MiB) 的 GPU 中选出扣除预留后可用显存最多的一块，没有则返回 None"""
+    reserved = reserved or {}
+    candidates = []
+    for gpu_id in (gpus if gpus is not None else sorted(history.total)):
+        free = history.effective_free(gpu_id) - reserved.get(gpu_id, 0)
+        if free >= min_free:
+            candidates.append((free, gpu_id))
+    if not candidates:
+        return None
+    return max(candidates)[1]
+
+def closest_gpu(history, min_free, reserved=None, gpus=None):
+    """显存总量足够的 GPU 中扣除预留后可用显存最多的一块（即最接近满足 min_free 的），没有则返回 None"""
+    reserved = reserved or {}
+    candidates = [
+        (history.effective_free(gpu_id) - reserved.get(gpu_id, 0), gpu_id)
+        for gpu_id in (gpus if gpus is not None else sorted(history.total))
+        if history.total.get(gpu_id, 0) >= min_free
+    ]
+    return max(candidates)[1] if candidates else None
+
+def plan_gpu(history, min_free, gpus=None, reserved=None, ahead=()):
+    """
+    在排队顺序下为当前任务选卡（EASY backfill）。
+
+    按顺序为前面每个当前就能放下的任务虚拟预留它会选中的 GPU。
+    最早一个暂时放不下的任务在最接近满足它的 GPU 上预留 min_free，
+    后面的任务只能使用该 GPU 上超出这部分的显存，因此它不会被源源不断的小任务饿死；
+    其余放不下的任务（以及显存总量都不够、永远放不下的任务）不阻塞后面的任务。
+    """
+    reserved = dict(reserved or {})
+    blocked = False
+    for their_min_free, their_gpus in ahead:
+        gpu_id = pick_gpu(history, their_min_free, reserved, their_gpus)
+        if gpu_id is None and not blocked:
+            gpu_id = closest_gpu(history, their_min_free, reserved, their_gpus)
+            blocked = gpu_id is not None
+        if gpu_id is not None:
+            reserved[gpu_id] = reserved.get(gpu_id, 0) + their_min_free
+    return pick_gpu(history, min_free, reserved, gpus)
+
+def wait_for_gpu(min_free, gpus=None, interval=1, window=30, lock_dir=DEFAULT_LOCK_DIR, hold=60):
+    """
+    排队等待，直到有 GPU 的空闲显存满足 min_free (MiB)，写入租约后返回 GPU 索引。
+
+    窗口内至少积累 min(window, 3) 次采样后才会选卡，以便参考最近的峰值占用。
+    """
+    history = MemoryHistory(window)
+    leases = GpuLeases(lock_dir, hold)
+    with leases:
+        leases.enqueue(min_free, gpus)
+    try:
+        with NvidiaSmiStream(interval_ms=int(interval * 1000)) as stream:
+            for nsample, memory_info in enumerate(stream, 1):
+                history.update(memory_info)
+                if nsample < min(window, 3):
+                    continue
+                with leases:
+                    gpu_id = plan_gpu(history, min_free, gpus, leases.reserved(), leases.ahead())
+                    if gpu_id is not None:
+                        leases.acquire(gpu_id, min_free)
+                        return gpu_id
+        raise RuntimeError("nvidia-smi 意外退出")
+    finally:
+        leases.dequeue()
+
+def run_command(command, gpu_id):
+    """设置 CUDA_VISIBLE_DEVICES 并用 exec 替换当前进程（pid 不变，租约随之生效）"""
+    os.environ["CUDA_DEVICE_ORDER"] = "PCI_BUS_ID"  # 与 nvidia-smi 的编号保持一致
+    os.environ["CUDA_VISIBLE_DEVICES"] = str(gpu_id)
+    os.execvp(command[0], command)
+
+def run_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="freegpu run",
+        description="Wait for a GPU with enough free memory, reserve it and run a command on it",
+    )
+    parser.add_argument('--min-free', type=parse_memory_size, required=True, help="Required free memory, e.g. 20G or 512M (plain numbers are MiB)")
+    parser.add_argument('--gpus', type=lambda s: [int(i) for i in s.split(',')], default=None, help="Comma separated GPU indices to choose from (default is all)")
+    parser.add_argument('--interval', type=float, default=1, help="Sampling interval in seconds (default is 1)")
+    parser.add_argument('--window', type=int, default=30, help="Number of samples kept to estimate peak usage (default is 30)")
+    parser.add_argument('--hold', type=float, default=60, help="Seconds a new lease reserves its memory before the job's own usage shows up (default is 60)")
+    parser.add_argument('--lock-dir', default=DEFAULT_LOCK_DIR, help=f"Directory shared by all launchers for leases and the queue (default is {DEFAULT_LOCK_DIR})")
+    parser.add_argument('command', nargs=argparse.REMAINDER, help="Command to run, after --")
+
+    args = parser.parse_args(argv)
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not command:
+        parser.error("no command given")
+
+    gpu_id = wait_for_gpu(args.min_free, args.gpus, args.interval, args.window, args.lock_dir, args.hold)
+    print(f"Running on GPU {gpu_id}: {' '.join(command)}", flush=True)
+    run_command(command, gpu_id)
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'run':
+        run_main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(description="Monitor GPU memory usage")
     parser.add_argument('start', type=int, nargs='?', default=0, help="The starting GPU index (default is 0)")
     parser.add_argument('end', type=int, nargs='?', default=-1, help="The ending GPU index (default is -1)")
@@ -0,0 +1,153 @@
+import h5py
+import numpy as np
+
+# 关键帧 + 逐步增量的密度轨迹存储。
+#
+# 数组形状为 (nx, ny, nz, nstep)，每隔 keyframe_interval 步保存一个完整的关键帧，
+# 其余步只保存与前一步的差：
+#   - tolerance=None  无损：保存与前一步浮点数位模式的异或 (XOR)，相邻步相近时高位全为 0；
+#   - tolerance=tol   有损：以约 2*tol 为步长把相对关键帧的变化量化为整数 Q，保存 Q 的逐步差，
+#                     重建误差不超过 tol，且不随步数累积。重建值最后要舍入到原精度（如 float32），
+#                     因此步长扣除了该舍入误差（一个 ulp），实际步长保存在 quantum 属性中。
+# 增量按步分块并用 shuffle+gzip 压缩，读取任意步时只需从最近的关键帧开始累加。
+
+ENCODING = "keyframe-delta"
+
+def _uint_view(dtype):
+    return np.dtype(f"u{np.dtype(dtype).itemsize}")
+
+def _smallest_int(values):
+    """能容纳 values 的最小有符号整数类型"""
+    bound = int(np.max(np.abs(values))) if values.size else 0
+    for dtype in (np.int8, np.int16, np.int32):
+        if bound <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+def write_delta(filename, key, data, keyframe_interval=10, tolerance=None, compression_level=4):
+    """
+    以关键帧 + 增量的形式把密度轨迹写入 HDF5 文件的 key 组（已存在时替换）。
+
+    :param filename: HDF5 文件路径，通常已由 HDF5Handler.save 写入其他数据。
+    :param key: 组名，如 "density"、"densityDB"。
+    :param data: 形状为 (nx, ny, nz, nstep) 的数组，步数在最后一维。
+    :param keyframe_interval: 关键帧间隔（步）。
+    :param tolerance: 量化的绝对误差上限（正数，需大于 data.dtype 的舍入误差），None 表示无损。
+    :param compression_level: gzip 压缩级别（1-9）。
+    """
+    if keyframe_interval < 1:
+        raise ValueError(f"keyframe_interval 必须至少为 1，而不是 {keyframe_interval}")
+    if tolerance is not None and not tolerance > 0:
+        raise ValueError(f"tolerance 必须为正数，而不是 {tolerance}")
+    data = np.asarray(data)
+    *grid, nstep = data.shape
+    step_chunks = tuple(grid) + (1,)
+    compression = dict(compression="gzip", compression_opts=compression_level, shuffle=True)
+    keyframes = list(range(0, nstep, keyframe_interval))
+
+    if tolerance is None:
+        delta_dtype = _uint_view(data.dtype)
+        deltas = np.zeros(data.shape, dtype=delta_dtype)
+        bits = data.view(delta_dtype) if data.flags.c_contiguous else np.ascontiguousarray(data).view(delta_dtype)
+        deltas[..., 1:] = bits[..., 1:] ^ bits[..., :-1]
+    else:
+        # 量化误差最多为 quantum/2，舍入到 data.dtype 最多再引入半个 ulp
+        ulp = float(np.spacing(np.asarray(np.abs(data).max() + tolerance, dtype=data.dtype))) if data.size else 0.0
+        quantum = 2.0 * tolerance - ulp
+        if quantum <= 0:
+            raise ValueError(f"tolerance={tolerance} 小于 {data.dtype} 的存储精度 {ulp / 2:g}")
+        values = data.astype(np.float64)
+        deltas = np.zeros(data.shape, dtype=np.int64)
+        for k in keyframes:
+            stop = min(k + keyframe_interval, nstep)
+            # 相对关键帧的量化值 Q，关键帧处 Q=0；保存相邻步 Q 的差
+            Q = np.rint((values[..., k:stop] - values[..., k:k + 1]) / quantum).astype(np.int64)
+            deltas[..., k + 1:stop] = np.diff(Q, axis=-1)
+        deltas = deltas.astype(_smallest_int(deltas))
+    # 关键帧位置不需要增量
+    deltas[..., keyframes] = 0
+
+    with h5py.File(filename, "a") as f:
+        if key in f:
+            del f[key]
+        group = f.create_group(key)
+        group.attrs["encoding"] = ENCODING
+        group.attrs["shape"] = data.shape
+        group.attrs["dtype"] = data.dtype.str
+        group.attrs["keyframe_interval"] = keyframe_interval
+        group.attrs["tolerance"] = -1.0 if tolerance is None else float(tolerance)
+        if tolerance is not None:
+            group.attrs["quantum"] = quantum
+        group.create_dataset("keyframes", data=data[..., keyframes], chunks=step_chunks, **compression)
+        group.create_dataset("deltas", data=deltas, chunks=step_chunks, **compression)
+
+def is_delta(group):
+    """判断 h5py 对象是否为 write_delta 写出的组"""
+    return isinstance(group, h5py.Group) and group.attrs.get("encoding") == ENCODING
+
+class DeltaReader:
+    """
+    按步范围读取 write_delta 写出的轨迹。
+
+    只读取 [start, stop) 所在关键帧区间内需要的关键帧和增量，
+    增量的累加（异或累积或整数累加）对整个区间向量化完成。
+    """
+
+    def __init__(self, group):
+        if not is_delta(group):
+            raise ValueError(f"{group.name} 不是 {ENCODING} 编码的数据")
+        self.group = group
+        self.shape = tuple(int(n) for n in group.attrs["shape"])
+        self.dtype = np.dtype(group.attrs["dtype"])
+        self.keyframe_interval = int(group.attrs["keyframe_interval"])
+        tolerance = float(group.attrs["tolerance"])
+        self.tolerance = None if tolerance < 0 else tolerance
+        self.quantum = float(group.attrs.get("quantum", 2.0 * tolerance))
+        self.nstep = self.shape[-1]
+
+    def __len__(self):
+        return self.nstep
+
+    def read(self, start=0, stop=None):
+        """重建第 [start, stop) 步，返回形状为 (nx, ny, nz, stop-start) 的数组"""
+        stop = self.nstep if stop is None else min(stop, self.nstep)
+        if not 0 <= start < stop:
+            raise IndexError(f"步范围 [{start}, {stop}) 超出 [0, {self.nstep})")
+        segments = []
+        k = start // self.keyframe_interval * self.keyframe_interval
+        while k < stop:
+            end = min(k + self.keyframe_interval, stop)
+            segment = self._read_segment(k, end)
+            segments.append(segment[..., max(start - k, 0):])
+            k += self.keyframe_interval
+        return np.concatenate(segments, axis=-1) if len(segments) > 1 else segments[0]
+
+    def _read_segment(self, k, end):
+        """从关键帧 k 开始重建第 [k, end) 步"""
+        keyframe = self.group["keyframes"][..., k // self.keyframe_interval][..., np.newaxis]
+        deltas = self.group["deltas"][..., k + 1:end]
+        if self.tolerance is None:
+            bits = keyframe.view(_uint_view(self.dtype))
+            accumulated = np.bitwise_xor.accumulate(deltas, axis=-1) ^ bits
+            return np.concatenate((bits, accumulated), axis=-1).view(self.dtype)
+        Q = np.cumsum(deltas, axis=-1, dtype=np.int64)
+        values = keyframe + Q * self.quantum
+        return np.concatenate((keyframe, values.astype(self.dtype)), axis=-1)
+
+    def __getitem__(self, index):
+        """支持按步整数或切片索引：reader[i]、reader[a:b]"""
+        if isinstance(index, slice):
+            start, stop, stride = index.indices(self.nstep)
+            return self.read(start, stop)[..., ::stride]
+        if index < 0:
+            index += self.nstep
+        return self.read(index, index + 1)[..., 0]
+
+def read_steps(filename, key, start=0, stop=None):
+    """
+    读取 write_delta 写出的第 [start, stop) 步。
+
+    :return: 形状为 (nx, ny, nz, stop-start) 的数组。
+    """
+    with h5py.File(filename, "r") as f:
+        return DeltaReader(f[key]).read(start, stop)
@@ -0,0 +1,109 @@
+import math
+import h5py
+import numpy as np
+
+# 密度数组的形状为 (nx, ny, nz, nstep)，步数在最后一维
+LAYOUTS = ("snapshot", "timeseries", "balanced")
+DTYPES = ("float64", "float32")
+# open_density 设置 chunk cache 时的访问模式
+ACCESS_PATTERNS = ("snapshot", "timeseries")
+
+# 目标块大小与 chunk cache 上限
+TARGET_CHUNK_BYTES = 1024 ** 2
+MAX_CACHE_BYTES = 512 * 1024 ** 2
+
+def _even(shape, chunks):
+    """保持每维块数不变，把块大小调整为尽量均分该维，减少边缘块的填充浪费"""
+    return tuple(math.ceil(n / math.ceil(n / c)) for n, c in zip(shape, chunks))
+
+def choose_chunks(shape, itemsize, layout="balanced", target_bytes=TARGET_CHUNK_BYTES):
+    """
+    根据访问模式选择 4D 密度数组 (nx, ny, nz, nstep) 的分块形状。
+
+    :param shape: 数组形状，最后一维为步数。
+    :param itemsize: 元素字节数。
+    :param layout: snapshot   每块覆盖一整个网格、一步，按步读取整个快照只需读一块；
+                   timeseries 每块沿步数方向尽量覆盖全部步，空间上切成小块，读单个格点的时间序列只需读一块；
+                   balanced   各维按同一比例缩小到约 target_bytes，两种访问都可接受。
+    :param target_bytes: timeseries/balanced 的目标块大小（字节）。
+    :return: 分块形状 tuple。
+    """
+    *grid, nstep = shape
+    if layout == "snapshot":
+        return tuple(grid) + (1,)
+
+    if layout == "timeseries":
+        steps = max(1, min(nstep, target_bytes // itemsize))
+        # 剩余预算按比例分给三个空间维度
+        voxels = max(1, target_bytes // (itemsize * steps))
+        scale = min(1.0, (voxels / math.prod(grid)) ** (1 / 3))
+        return _even(shape, tuple(max(1, int(n * scale)) for n in grid) + (steps,))
+
+    if layout == "balanced":
+        scale = min(1.0, (target_bytes / (itemsize * math.prod(shape))) ** (1 / 4))
+        return _even(shape, tuple(max(1, int(n * scale)) for n in shape))
+
+    raise ValueError(f"未知的布局: {layout}，可选 {', '.join(LAYOUTS)}")
+
+def chunk_cache_size(shape, chunks, itemsize, access="snapshot", max_bytes=MAX_CACHE_BYTES):
+    """
+    按访问模式确定 chunk cache 大小，使一次访问涉及的块能留在 cache 中供下一次访问复用：
+    snapshot   读取一步的整个网格，涉及一层空间方向上的全部块（snapshot 布局下即一块）；
+    timeseries 读取单个格点的全部步，涉及步方向上的一列块（timeseries 布局下即一块）。
+    放不下时以 max_bytes 为上限。
+
+    :return: (rdcc_nbytes, rdcc_nslots)
+    """
+    chunk_bytes = math.prod(chunks) * itemsize
+    if access == "snapshot":
+        nchunks = math.prod(math.ceil(n / c) for n, c in zip(shape[:-1], chunks[:-1]))
+    elif access == "timeseries":
+        nchunks = math.ceil(shape[-1] / chunks[-1])
+    else:
+        raise ValueError(f"未知的访问模式: {access}，可选 {', '.join(ACCESS_PATTERNS)}")
+    nbytes = min(nchunks * chunk_bytes, max_bytes)
+    # HDF5 建议 slot 数取块数的 100 倍左右的质数，这里取奇数即可
+    nslots = max(521, (nbytes // chunk_bytes) * 100 + 1)
+    return nbytes, nslots
+
+def write_density(filename, key, data, layout="balanced", dtype=None):
+    """
+    以指定布局和精度把密度数组追加写入 HDF5 文件（已存在的同名数据集会被替换）。
+
+    :param filename: HDF5 文件路径，通常已由 HDF5Handler.save 写入其他数据。
+    :param key: 数据集名，如 "density"、"densityDB"。
+    :param data: 形状为 (nx, ny, nz, nstep) 的数组。
+    :param layout: 见 choose_chunks。
+    :param dtype: 保存精度，如 "float32"；默认保持原精度。
+    """
+    data = np.asarray(data)
+    if dtype is not None:
+        data = data.astype(dtype, copy=False)
+    chunks = choose_chunks(data.shape, data.dtype.itemsize, layout)
+    with h5py.File(filename, "a") as f:
+        if key in f:
+            del f[key]
+        dset = f.create_dataset(key, data=data, chunks=chunks)
+        dset.attrs["layout"] = layout
+
+def open_density(filename, key, access=None, max_cache_bytes=MAX_CACHE_BYTES):
+    """
+    打开密度数据集，并按访问模式设置该数据集的 chunk cache。
+
+    cache 只对这里返回的数据集生效；直接用 h5py.File 打开的读取方仍使用 HDF5 默认的 cache。
+
+    :param access: 见 chunk_cache_size；None 表示保持 HDF5 默认 cache，
+                   适用于每块只读取一次的访问（如按块对齐的步范围顺序读取）。
+    :param max_cache_bytes: cache 上限（字节），多进程读取时为每个进程的上限。
+    :return: (h5py.File, h5py.Dataset)，用完后需关闭文件。
+    """
+    f = h5py.File(filename, "r")
+    dset = f[key]
+    if dset.chunks is None or access is None:
+        return f, dset
+    nbytes, nslots = chunk_cache_size(dset.shape, dset.chunks, dset.dtype.itemsize, access, max_cache_bytes)
+    # 数据集仍处于打开状态时 HDF5 会复用已有的对象，忽略新的 dapl，需先释放
+    del dset
+    dapl = h5py.h5p.create(h5py.h5p.DATASET_ACCESS)
+    dapl.set_chunk_cache(nslots, nbytes, 0.75)
+    return f, h5py.Dataset(h5py.h5d.open(f.id, key.encode(), dapl=dapl))
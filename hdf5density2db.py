@@ -2,12 +2,20 @@ import os
 import argparse
 from qakits.hdf5 import HDF5Handler
 import numpy as np
+from lazyhdf5 import load_lazy, materialize, release
+from h5layout import LAYOUTS, DTYPES, write_density
+from h5delta import write_delta
 
-def process_step(filename):
+def process_step(filename, lazy=False):
     """
     处理单个文件的步骤。
     使用 HDF5Handler 读取文件并返回数据。
+
+    lazy=True 时返回 LazyData：数组为按需读取的代理（连续存储的数据集直接内存映射），
+    用完后需调用 close() 释放文件。
     """
+    if lazy:
+        return load_lazy(filename)
     handler = HDF5Handler()
     handler.read(filename, format="hdf5")
     return handler.data
@@ -26,8 +34,41 @@ def main():
         type=str,
         help="一个或多个输入文件路径（HDF5 格式）"
     )
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="按需读取输入文件（连续存储的数据集直接内存映射），避免完整加载"
+    )
+    parser.add_argument(
+        "--layout",
+        choices=LAYOUTS,
+        help="按访问模式选择 densityDB 的分块：snapshot 按步读取整个网格，timeseries 读取格点的时间序列，balanced 兼顾两者；不能与 --keyframe-interval 同时使用"
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=DTYPES,
+        help="densityDB 的保存精度，float32 可减半文件大小和读写量"
+    )
+    parser.add_argument(
+        "--keyframe-interval",
+        type=int,
+        help="以关键帧 + 逐步增量的形式保存 densityDB，每隔该步数保存一个关键帧（用 h5delta.DeltaReader 读取）"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        help="增量量化的绝对误差上限（需配合 --keyframe-interval），不指定时无损保存"
+    )
 
     args = parser.parse_args()
+    if args.keyframe_interval is not None and args.keyframe_interval < 1:
+        parser.error("--keyframe-interval must be at least 1")
+    if args.tolerance is not None and args.tolerance <= 0:
+        parser.error("--tolerance must be positive")
+    if args.tolerance is not None and args.keyframe_interval is None:
+        parser.error("--tolerance requires --keyframe-interval")
+    if args.layout and args.keyframe_interval is not None:
+        parser.error("--layout cannot be combined with --keyframe-interval (keyframe/delta data is always chunked per step)")
     output_file = args.output_file
     input_files = args.input_files
 
@@ -38,13 +79,15 @@ def main():
             print(f"文件 {filename} 不存在，跳过...")
             continue
 
-        data = process_step(filename)
+        data = process_step(filename, lazy=args.lazy)
 
         if i == 0:  # 第一个输入文件
             # 将所有非 "density" 的数据直接复制到 alldata
-            alldata.update({key: value for key, value in data.items() if key != "density"})
+            alldata.update({key: materialize(value) for key, value in data.items() if key != "density"})
             # 初始化 density 数据，增加新维度
-            alldata["densityDB"] = data["density"][..., np.newaxis]
+            # lazy 模式下 density 是输入文件的内存映射，复制一份以免关闭/覆盖输入文件后失效
+            density = np.array(data["density"]) if args.lazy else data["density"]
+            alldata["densityDB"] = density[..., np.newaxis]
         else:
             # 拼接到新的维度（nstep）
             alldata["densityDB"] = np.concatenate(
@@ -52,10 +95,28 @@ def main():
                 axis=-1
             )
 
+        if args.lazy:
+            release(data)
+
     # 保存合并数据到输出文件
     handler = HDF5Handler()
-    handler.data = alldata
-    handler.save(output_file, format="hdf5")
+    if args.keyframe_interval is not None:
+        # densityDB 以关键帧 + 增量的形式单独写入
+        densityDB = alldata.pop("densityDB")
+        if args.dtype:
+            densityDB = densityDB.astype(args.dtype)
+        handler.data = alldata
+        handler.save(output_file, format="hdf5")
+        write_delta(output_file, "densityDB", densityDB, keyframe_interval=args.keyframe_interval, tolerance=args.tolerance)
+    elif args.layout or args.dtype:
+        # densityDB 由 write_density 按指定布局/精度单独写入
+        densityDB = alldata.pop("densityDB")
+        handler.data = alldata
+        handler.save(output_file, format="hdf5")
+        write_density(output_file, "densityDB", densityDB, layout=args.layout or "balanced", dtype=args.dtype)
+    else:
+        handler.data = alldata
+        handler.save(output_file, format="hdf5")
     print(f"数据已保存到 {output_file}")
 
 if __name__ == "__main__":
@@ -1,6 +1,15 @@
 import argparse
 import os
+import io
+import sys
+import html
+import json
+import time
+import bisect
 import socket
+import threading
+import urllib.parse
+from collections import OrderedDict
 from http.server import SimpleHTTPRequestHandler, HTTPServer
 from socketserver import TCPServer
 
@@ -33,6 +42,57 @@ def get_all_local_ips():
 
     return list(set(local_ips))  # 去重
 
+class DirectoryListingCache:
+    """
+    目录列表缓存，键为目录路径，目录 mtime 变化（增删条目）时重建。
+
+    用 os.scandir 一次取得名称、类型和 stat 信息，按小写名称排序后保存，
+    便于分页和用二分查找做（不区分大小写的）前缀过滤。文件大小变化不会改变目录 mtime，
+    因此缓存另有 ttl 秒的有效期。
+    """
+
+    def __init__(self, max_dirs=64, ttl=10):
+        self.max_dirs = max_dirs
+        self.ttl = ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """返回 (小写名称列表, 条目列表)，条目为 (name, is_dir, size, mtime)"""
+        mtime = os.stat(path).st_mtime_ns
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached and cached[0] == mtime and now - cached[1] < self.ttl:
+                self._cache.move_to_end(path)
+                return cached[2]
+
+        listing = self._scan(path)
+        with self._lock:
+            self._cache[path] = (mtime, now, listing)
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.max_dirs:
+                self._cache.popitem(last=False)
+        return listing
+
+    @staticmethod
+    def _scan(path):
+        entries = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    st = entry.stat()
+                    size, mtime = (0 if is_dir else st.st_size), st.st_mtime
+                except OSError:
+                    # 失效的符号链接等
+                    is_dir, size, mtime = False, 0, 0
+                entries.append((entry.name, is_dir, size, mtime))
+        entries.sort(key=lambda e: e[0].lower())
+        return [e[0].lower() for e in entries], entries
+
+listing_cache = DirectoryListingCache()
+
 class RangeRequestHandler(SimpleHTTPRequestHandler):
     """支持断点续传的HTTP请求处理器"""
 
@@ -81,6 +141,117 @@ class RangeRequestHandler(SimpleHTTPRequestHandler):
         except Exception as e:
             self.send_error(500, f"Internal Server Error: {str(e)}")
 
+    def list_directory(self, path):
+        """
+        带缓存和分页的目录列表，支持以下查询参数:
+            format=json   返回 JSON，便于脚本和下载工具使用
+            prefix=abc    只列出名称以 abc 开头的条目（不区分大小写，与排序一致）
+            page=N        第 N 页（从 1 开始），超过总页数时返回空列表
+            per_page=M    每页条目数（默认 1000，最多 100000）
+        page/per_page 不是正整数时返回 400。
+
+        JSON 格式: {"path", "prefix", "page", "per_page", "pages", "total",
+                    "entries": [{"name", "is_dir", "size", "mtime"}, ...]}，
+        total 为前缀过滤后的条目总数，pages 至少为 1。
+        """
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        fmt = query.get("format", ["html"])[0]
+        prefix = query.get("prefix", [""])[0]
+        try:
+            page = int(query.get("page", ["1"])[0])
+            per_page = min(int(query.get("per_page", ["1000"])[0]), 100000)
+            if page < 1 or per_page < 1:
+                raise ValueError
+        except ValueError:
+            self.send_error(400, "Invalid page or per_page")
+            return None
+
+        try:
+            keys, entries = listing_cache.get(path)
+        except OSError:
+            self.send_error(404, "No permission to list directory")
+            return None
+
+        # 条目按小写名称排序，以小写前缀开头的条目是连续的一段，二分查找即可定位
+        if prefix:
+            lower = prefix.lower()
+            lo = bisect.bisect_left(keys, lower)
+            hi = bisect.bisect_right(keys, lower + "\U0010ffff", lo)
+            entries = entries[lo:hi]
+        total = len(entries)
+        start = (page - 1) * per_page
+        entries = entries[start:start + per_page]
+        pages = max(1, -(-total // per_page))
+
+        if fmt == "json":
+            body = json.dumps({
+                "path": urllib.parse.unquote(urllib.parse.urlsplit(self.path).path),
+                "prefix": prefix,
+                "page": page,
+                "per_page": per_page,
+                "pages": pages,
+                "total": total,
+                "entries": [
+                    {"name": name, "is_dir": is_dir, "size": size, "mtime": mtime}
+                    for name, is_dir, size, mtime in entries
+                ],
+            }, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        else:
+            body = self.render_listing(entries, prefix, page, per_page, pages, total)
+            content_type = f"text/html; charset={sys.getfilesystemencoding()}"
+
+        f = io.BytesIO(body)
+        self.send_response(200)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        return f
+
+    def render_listing(self, entries, prefix, page, per_page, pages, total):
+        """生成一页目录列表的 HTML（格式同 SimpleHTTPRequestHandler）"""
+        urlpath = urllib.parse.urlsplit(self.path).path
+        try:
+            displaypath = urllib.parse.unquote(urlpath, errors="surrogatepass")
+        except UnicodeDecodeError:
+            displaypath = urllib.parse.unquote(urlpath)
+        displaypath = html.escape(displaypath, quote=False)
+        enc = sys.getfilesystemencoding()
+        title = f"Directory listing for {displaypath}"
+
+        def page_link(n, text):
+            params = {"page": n, "per_page": per_page}
+            if prefix:
+                params["prefix"] = prefix
+            return f'<a href="?{html.escape(urllib.parse.urlencode(params))}">{text}</a>'
+
+        nav = [f"{total} entries, page {page}/{pages}"]
+        if page > 1:
+            nav.append(page_link(page - 1, "&laquo; prev"))
+        if page < pages:
+            nav.append(page_link(page + 1, "next &raquo;"))
+
+        r = []
+        r.append("<!DOCTYPE HTML>")
+        r.append('<html lang="en">')
+        r.append("<head>")
+        r.append(f'<meta charset="{enc}">')
+        r.append(f"<title>{title}</title>\n</head>")
+        r.append(f"<body>\n<h1>{title}</h1>")
+        r.append(f'<form method="get">Prefix: <input name="prefix" value="{html.escape(prefix)}">'
+                 f'<input type="hidden" name="per_page" value="{per_page}"></form>')
+        r.append(f"<p>{' | '.join(nav)}</p>")
+        r.append("<hr>\n<ul>")
+        for name, is_dir, size, mtime in entries:
+            linkname = displayname = name + "/" if is_dir else name
+            r.append('<li><a href="%s">%s</a></li>'
+                     % (urllib.parse.quote(linkname, errors="surrogatepass"),
+                        html.escape(displayname, quote=False)))
+        r.append("</ul>\n<hr>")
+        r.append(f"<p>{' | '.join(nav)}</p>")
+        r.append("</body>\n</html>\n")
+        return "\n".join(r).encode(enc, "surrogateescape")
+
     def parse_range_header(self, range_header, file_size):
         """解析Range头字段"""
         try:
@@ -0,0 +1,169 @@
+import threading
+import weakref
+import h5py
+import numpy as np
+
+class H5FileRef:
+    """
+    带引用计数的只读 h5py 文件句柄。
+
+    每个 LazyDataset 和 LazyData 各持有一个引用，全部释放后才真正关闭文件，
+    因此下游代码不会在文件已关闭时读到无效的数据集。
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = h5py.File(filename, "r")
+        self.refcount = 1
+        self._lock = threading.Lock()
+
+    @property
+    def closed(self):
+        return self.file is None
+
+    def acquire(self):
+        with self._lock:
+            if self.file is None:
+                raise ValueError(f"文件 {self.filename} 已关闭")
+            self.refcount += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self.refcount -= 1
+            if self.refcount == 0 and self.file is not None:
+                self.file.close()
+                self.file = None
+
+def _is_mappable(dataset):
+    """连续存储、未压缩且已分配空间的数值数据集可以直接内存映射"""
+    return (
+        dataset.chunks is None
+        and dataset.compression is None
+        and dataset.dtype.kind in "biufc"
+        and dataset.id.get_offset() is not None
+    )
+
+class LazyDataset:
+    """
+    h5py 数据集的惰性代理，只有在被索引时才读取数据。
+
+    连续、未压缩的数据集直接用 np.memmap 映射文件，索引返回映射视图；
+    其他数据集（分块/压缩）通过 h5py 按需读取。
+    """
+
+    def __init__(self, ref, name):
+        dataset = ref.file[name]
+        self.name = name
+        self.shape = dataset.shape
+        self.dtype = dataset.dtype
+        self.ndim = dataset.ndim
+        self.size = dataset.size
+        self.attrs = dict(dataset.attrs)
+        self.mappable = _is_mappable(dataset)
+        self._offset = dataset.id.get_offset() if self.mappable else None
+        self._memmap = None
+        self._ref = ref.acquire()
+        self._release = weakref.finalize(self, ref.release)
+
+    @property
+    def closed(self):
+        return not self._release.alive or self._ref.closed
+
+    def close(self):
+        """释放对文件的引用；之后再访问该代理会报错"""
+        self._memmap = None
+        self._release()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if self.closed:
+            raise ValueError(f"数据集 {self.name} 已关闭")
+        if self.mappable:
+            if self._memmap is None:
+                self._memmap = np.memmap(
+                    self._ref.filename, dtype=self.dtype, mode="r",
+                    offset=self._offset, shape=self.shape,
+                )
+            return self._memmap[key]
+        dataset = self._ref.file[self.name]
+        try:
+            return dataset[key]
+        except (TypeError, ValueError):
+            # h5py 不支持的索引（如 np.newaxis、负步长）先整体读取再索引
+            return dataset[()][key]
+
+    def __array__(self, dtype=None, copy=None):
+        data = np.asarray(self[...])
+        return data.astype(dtype, copy=False) if dtype is not None else data
+
+    def __repr__(self):
+        state = "closed" if self.closed else ("memmap" if self.mappable else "h5py")
+        return f"<LazyDataset {self.name!r} shape={self.shape} dtype={self.dtype} ({state})>"
+
+class LazyData(dict):
+    """
+    与 HDF5Handler.data 结构相同的字典，数组为 LazyDataset 代理，标量直接读取。
+
+    close() 只释放字典自身持有的引用：仍被下游保留的代理会让文件保持打开，
+    直到它们也被关闭或回收。
+    """
+
+    def __init__(self, filename):
+        super().__init__()
+        self._ref = H5FileRef(filename)
+        self._closed = False
+        try:
+            self.update(_load_group(self._ref, self._ref.file))
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.clear()
+            self._ref.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _load_group(ref, group):
+    data = {}
+    for key, item in group.items():
+        if isinstance(item, h5py.Group):
+            data[key] = _load_group(ref, item)
+        elif item.shape == () or item.shape is None:
+            # 标量（网格大小、步长等元数据）直接读取
+            value = item[()]
+            data[key] = value.decode() if isinstance(value, bytes) else value
+        else:
+            data[key] = LazyDataset(ref, item.name)
+    return data
+
+def load_lazy(filename):
+    """
+    惰性读取 HDF5 文件。
+
+    :param filename: HDF5 文件路径。
+    :return: LazyData，数组在被索引时才从文件读取。
+    """
+    return LazyData(filename)
+
+def release(data):
+    """关闭 load_lazy 返回的数据；对普通字典（如从文本格式读取的数据）不做任何事"""
+    if isinstance(data, LazyData):
+        data.close()
+
+def materialize(data):
+    """将（嵌套）字典中的 LazyDataset 全部读入内存，返回普通的 numpy 数组"""
+    if isinstance(data, dict):
+        return {key: materialize(value) for key, value in data.items()}
+    if isinstance(data, LazyDataset):
+        return np.array(data)
+    return data
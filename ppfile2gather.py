@@ -3,26 +3,33 @@ import os
 import argparse
 from qakits.hdf5 import HDF5Handler
 import numpy as np
+from lazyhdf5 import load_lazy, materialize, release
+from h5layout import LAYOUTS, DTYPES, write_density
+from h5delta import write_delta
 
-def process_step(N):
+def process_step(N, lazy=False):
     """处理每个步骤，读取并返回数据。
     
     根据文件存在性动态决定读取模式：
     - 如果 `chargedensity.hdf5` 存在，使用 HDF5 格式读取。
+      lazy=True 时返回 LazyData（按需读取/内存映射的代理），用完后需调用 close()。
     - 否则，默认使用 `ppfilplot` 格式读取 `chargedensity.txt`。
     """
     print(f"Processing N={N}")
-    handler = HDF5Handler()
     
     # 优先尝试读取 HDF5 文件
     filename = os.path.join(f"{N}", "chargedensity.hdf5")
     if os.path.exists(filename):
+        if lazy:
+            return load_lazy(filename)
         # 如果 HDF5 文件存在，则使用 HDF5 格式读取
         # HDF5 的读写会很快
+        handler = HDF5Handler()
         handler.read(filename, format="hdf5")
     else:
         # 如果 HDF5 文件不存在，则尝试读取文本格式的 `chargedensity.txt`
         filename = os.path.join(f"{N}", "chargedensity.txt")
+        handler = HDF5Handler()
         handler.read(filename, format="ppfilplot")
     
     # 返回处理后的数据
@@ -39,9 +46,22 @@ def main():
     parser.add_argument("startstep", type=int, help="The start step.")
     parser.add_argument("dstep", type=int, help="The step increment.")
     parser.add_argument("endstep", type=int, help="The end step.")
+    parser.add_argument("--lazy", action="store_true", help="Read chargedensity.hdf5 lazily (memory-mapped when contiguous) instead of loading it fully.")
+    parser.add_argument("--layout", choices=LAYOUTS, help="Chunk layout of the density cube: snapshot for per-step reads, timeseries for per-voxel series, balanced for both. Cannot be combined with --keyframe-interval.")
+    parser.add_argument("--dtype", choices=DTYPES, help="Precision of the saved density cube; float32 halves size and I/O.")
+    parser.add_argument("--keyframe-interval", type=int, help="Store density as keyframes every N steps plus step-to-step deltas (read back with h5delta.DeltaReader).")
+    parser.add_argument("--tolerance", type=float, help="Quantize deltas to this absolute tolerance (with --keyframe-interval); lossless if omitted.")
     
     # 解析命令行参数
     args = parser.parse_args()
+    if args.keyframe_interval is not None and args.keyframe_interval < 1:
+        parser.error("--keyframe-interval must be at least 1")
+    if args.tolerance is not None and args.tolerance <= 0:
+        parser.error("--tolerance must be positive")
+    if args.tolerance is not None and args.keyframe_interval is None:
+        parser.error("--tolerance requires --keyframe-interval")
+    if args.layout and args.keyframe_interval is not None:
+        parser.error("--layout cannot be combined with --keyframe-interval (keyframe/delta data is always chunked per step)")
 
     startstep = args.startstep
     dstep = args.dstep
@@ -52,27 +72,47 @@ def main():
 
     # 循环遍历每个步长
     for N in range(startstep, endstep + 1, dstep):
-        data = process_step(N)
+        data = process_step(N, lazy=args.lazy)
         
         # 对于第一个步骤，保存初始的配置信息
         if N == startstep:
             # 将所有非 "plot" 的数据直接复制到 alldata
-            alldata.update({key: value for key, value in data.items() if key != "plot"})
+            alldata.update({key: materialize(value) for key, value in data.items() if key != "plot"})
             alldata["startstep"] = startstep
             alldata["dstep"] = dstep
             alldata["endstep"] = endstep
             # 初始化 density 数据，增加新维度
-            alldata["density"] = data["plot"][..., np.newaxis]  
+            # lazy 模式下 plot 是输入文件的内存映射，复制一份以免关闭/覆盖输入文件后失效
+            plot = np.array(data["plot"]) if args.lazy else data["plot"]
+            alldata["density"] = plot[..., np.newaxis]
         else:
             # 使用 np.concatenate 在新的维度（nstep）拼接数据
             alldata["density"] = np.concatenate((alldata["density"], data["plot"][..., np.newaxis]), axis=-1)
 
+        if args.lazy:
+            release(data)
+
     # 创建 HDF5Handler 实例并保存数据
     handler = HDF5Handler()
     # 使用更明确的文件名格式
     filename = f"chargedensity.{startstep}_{dstep}_{endstep}.hdf5"
-    handler.data = alldata
-    handler.save(filename, format="hdf5")
+    if args.keyframe_interval is not None:
+        # density 以关键帧 + 增量的形式单独写入
+        density = alldata.pop("density")
+        if args.dtype:
+            density = density.astype(args.dtype)
+        handler.data = alldata
+        handler.save(filename, format="hdf5")
+        write_delta(filename, "density", density, keyframe_interval=args.keyframe_interval, tolerance=args.tolerance)
+    elif args.layout or args.dtype:
+        # density 由 write_density 按指定布局/精度单独写入
+        density = alldata.pop("density")
+        handler.data = alldata
+        handler.save(filename, format="hdf5")
+        write_density(filename, "density", density, layout=args.layout or "balanced", dtype=args.dtype)
+    else:
+        handler.data = alldata
+        handler.save(filename, format="hdf5")
     print(f"Data saved to {filename}")
 
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+统一的命令行入口: qkit <subcommand> [args ...]
+
+各子命令对应的脚本只有在运行该子命令时才会被导入，
+因此 qkit hash、qkit calc 等轻量命令不会为 numpy/h5py/torch 付出启动开销。
+
+安装: 把本文件链接到 PATH 中即可，例如
+    ln -s /path/to/qkit/qkit.py ~/bin/qkit
+Python 会解析符号链接，子命令脚本仍从本仓库目录导入。
+"""
+
+import sys
+import importlib
+
+# 子命令 -> (模块名, 简要说明)；模块需提供读取 sys.argv 的 main()
+SUBCOMMANDS = {
+    "gather": ("ppfile2gather", "Gather chargedensity of many steps into one HDF5 file"),
+    "density2db": ("hdf5density2db", "Merge density HDF5 files into a densityDB"),
+    "analyze": ("densityanalysis", "Planar averages and region integrals of a density database"),
+    "dipole": ("ppfile2dipole", "Compute the dipole of a pp.x chargedensity file"),
+    "h5view": ("hdf5viewer", "Show the structure or data of an HDF5 file"),
+    "compress": ("compress_hdf5", "Compress an HDF5 file with gzip"),
+    "serve": ("httpserver", "Share the current directory over HTTP with range support"),
+    "wget": ("pywget", "Download a file with resume support"),
+    "hash": ("pymd5", "Compute the hash of a file"),
+    "units": ("energy2all", "Convert an energy to other units"),
+    "calc": ("cal", "Evaluate expressions"),
+    "gpu": ("freegpu", "Monitor GPU memory or run a job on a free GPU"),
+}
+
+def usage():
+    lines = ["Usage: qkit <subcommand> [args ...]", "", "Subcommands:"]
+    for name, (_, help_text) in SUBCOMMANDS.items():
+        lines.append(f"  {name:<12} {help_text}")
+    lines.append("")
+    lines.append("Run 'qkit <subcommand> -h' for help on a subcommand.")
+    return "\n".join(lines)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0
+    name = argv[0]
+    if name not in SUBCOMMANDS:
+        print(f"qkit: unknown subcommand '{name}'\n", file=sys.stderr)
+        print(usage(), file=sys.stderr)
+        return 2
+
+    module_name, _ = SUBCOMMANDS[name]
+    # 子命令脚本按 sys.argv 解析参数，这里改写为 "qkit <subcommand> ..." 的形式
+    sys.argv = [f"qkit {name}"] + argv[1:]
+    module = importlib.import_module(module_name)
+    return module.main()
+
+if __name__ == "__main__":
+    sys.exit(main())
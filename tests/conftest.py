@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+# 脚本都在仓库根目录，以 "python foo.py" 方式运行，测试时同样从根目录导入
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+_FAKE_NVIDIA_SMI = """#!/bin/sh
+# 假的 nvidia-smi：每轮输出 $FAKE_SMI_OUTPUT 文件的内容，带 --loop-ms 时循环输出
+loop=""
+for a in "$@"; do case "$a" in --loop-ms=*) loop="${a#--loop-ms=}";; esac; done
+while :; do
+  cat "$FAKE_SMI_OUTPUT"
+  [ -z "$loop" ] && exit 0
+  sleep 0.05
+done
+"""
+
+
+@pytest.fixture
+def fake_nvidia_smi(tmp_path, monkeypatch):
+    """在 PATH 最前面放一个假的 nvidia-smi，返回用于设置其输出内容的函数"""
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    script = bindir / "nvidia-smi"
+    script.write_text(_FAKE_NVIDIA_SMI)
+    script.chmod(0o755)
+    output = tmp_path / "nvidia-smi.out"
+    monkeypatch.setenv("PATH", f"{bindir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_SMI_OUTPUT", str(output))
+
+    def set_output(lines):
+        output.write_text("".join(line + "\n" for line in lines))
+
+    return set_output
@@ -0,0 +1,63 @@
+import os
+
+import h5py
+import numpy as np
+
+import benchmark
+
+
+def test_generators(tmp_path):
+    paths = benchmark.generate_inputs(str(tmp_path), (5, 4, 3), 2, 1000)
+    with open(paths["ppfile"]) as f:
+        lines = f.read().splitlines()
+    assert [int(n) for n in lines[1].split()] == [5, 4, 3, 5, 4, 3, 2, 1]
+    # 10 行头信息之后为 5 个一行的数据，共 5*4*3 个
+    values = " ".join(lines[10:]).split()
+    assert len(values) == 60
+    assert sorted(os.listdir(paths["stepdir"])) == ["1", "2"]
+    with h5py.File(paths["densities"][0]) as f:
+        assert f["density"].shape == (5, 4, 3)
+        assert f["grid/nr1x"][()] == 5
+    assert os.path.getsize(paths["blob"]) == 1000
+
+
+def test_failed_transfer_is_an_error(tmp_path):
+    blob = tmp_path / "blob.bin"
+    blob.write_bytes(b"x" * 100)
+    outdir = tmp_path / "out"
+    outdir.mkdir()
+    # 没有服务监听的端口：pywget 打印错误但以 0 退出
+    paths = {"blob": str(blob), "port": benchmark._free_port()}
+    command, cwd = benchmark.bench_transfer(paths, str(outdir), 1)
+    _, _, returncode, _ = benchmark.run_measured(command, cwd)
+    assert returncode == 0
+    assert benchmark.CHECKS["transfer"](paths, str(outdir), 1)
+
+    (outdir / "download.bin").write_bytes(b"x" * 10)
+    assert "expected 100" in benchmark.CHECKS["transfer"](paths, str(outdir), 1)
+    (outdir / "download.bin").write_bytes(b"x" * 100)
+    assert benchmark.CHECKS["transfer"](paths, str(outdir), 1) is None
+
+
+def test_gather_runs_in_outdir(tmp_path):
+    stepdir = tmp_path / "steps"
+    benchmark.make_step_dirs(str(stepdir), (2, 2, 2), 1, 1, 3)
+    outdir = tmp_path / "out"
+    outdir.mkdir()
+    command, cwd = benchmark.bench_gather({"stepdir": str(stepdir)}, str(outdir), 3)
+    assert cwd == str(outdir)
+    assert sorted(os.listdir(outdir)) == ["1", "2", "3"]
+    assert os.path.isfile(outdir / "1" / "chargedensity.txt")
+
+
+def test_compare_flags_regressions(capsys):
+    base = {"results": {"hash": {"wall_s_min": 1.0, "peak_rss_mb": 10.0}}}
+    assert benchmark.compare({"hash": {"wall_s_min": 1.5, "peak_rss_mb": 10.0}}, base, 1.2) == ["hash"]
+    assert benchmark.compare({"hash": {"wall_s_min": 1.1, "peak_rss_mb": 10.0}}, base, 1.2) == []
+
+
+def test_synthetic_density_is_periodic_and_drifts():
+    a = benchmark.synthetic_density((8, 8, 8), step=0)
+    b = benchmark.synthetic_density((8, 8, 8), step=1)
+    assert a.shape == (8, 8, 8)
+    assert 0 < np.abs(a - b).max() < 0.1
@@ -0,0 +1,133 @@
+import io
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import cal
+from conftest import ROOT
+
+
+@pytest.mark.parametrize("expr", [
+    "__import__('os')",
+    "x.__class__",
+    "np.ones(3).sum()",
+    "np.save",
+    "np.load('a.npy')",
+    "sqrt(x=2)",
+    "(lambda: 1)()",
+    "[1, 2][0]",
+    "x[0]",
+    "open('f')",
+    "sin(1)(2)",
+])
+def test_compile_expr_rejects_unsafe(expr):
+    with pytest.raises((ValueError, SyntaxError)):
+        cal.compile_expr(expr)
+
+
+def test_compile_expr_no_builtins():
+    code, names = cal.compile_expr("abs(x)")
+    assert names == ["x"]
+    assert cal.evaluate(code, {"x": -2.0}) == 2.0
+    code, names = cal.compile_expr("len")
+    with pytest.raises(NameError):
+        cal.evaluate(code)
+
+
+def test_free_variables_alphabetical():
+    _, names = cal.compile_expr("sin(y) + x*np.pi + hypot(z, x)")
+    assert names == ["x", "y", "z"]
+
+
+def test_evaluate_stream_binds_columns():
+    out = io.StringIO()
+    cal.evaluate_stream("x*2 + y", io.StringIO("1 10\n# comment\n\n2 20\n"), out=out)
+    assert np.allclose(np.loadtxt(io.StringIO(out.getvalue())), [12, 24])
+
+
+def test_evaluate_stream_explicit_names_and_scalar():
+    out = io.StringIO()
+    cal.evaluate_stream("b - a", io.StringIO("1 5\n2 7\n"), out=out, names=["a", "b"])
+    assert np.allclose(np.loadtxt(io.StringIO(out.getvalue())), [4, 5])
+    out = io.StringIO()
+    cal.evaluate_stream("pi", io.StringIO("0\n0\n"), out=out, names=["x"])
+    assert np.allclose(np.loadtxt(io.StringIO(out.getvalue())), [np.pi, np.pi])
+
+
+def test_evaluate_stream_blocks():
+    values = np.arange(1000.0)
+    text = "\n".join(f"{v}" for v in values) + "\n"
+    blocks = list(cal.read_blocks(io.StringIO(text), block_size=300))
+    assert [len(b) for b in blocks] == [300, 300, 300, 100]
+    out = io.StringIO()
+    cal.evaluate_stream("sqrt(x)", io.StringIO(text), out=out, block_size=300)
+    assert np.allclose(np.loadtxt(io.StringIO(out.getvalue())), np.sqrt(values))
+
+
+def test_evaluate_stream_missing_columns():
+    with pytest.raises(ValueError):
+        cal.evaluate_stream("x + y", io.StringIO("1\n"), out=io.StringIO())
+
+
+def test_repl_assignment_and_errors():
+    out = io.StringIO()
+    cal.repl(io.StringIO("a = 3\nsqrt(a*3)\n__import__('os')\n"), out=out)
+    lines = out.getvalue().splitlines()
+    assert float(lines[0]) == 3.0
+    assert lines[1].startswith("错误")
+
+
+@pytest.mark.parametrize("expr,expected", [
+    ("1+2", "3"),
+    ("sqrt(4)", "2.0"),
+    ("np.sqrt(4)", "2.0"),
+    ("numpy.sqrt(9)", "3.0"),
+])
+def test_legacy_mode(expr, expected):
+    result = subprocess.run([sys.executable, "cal.py", expr], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.splitlines()[-1].split("=")[-1].strip() == expected
+
+
+@pytest.mark.parametrize("expr", ["x - np.mean(x)", "np.cumsum(x)", "np.sum(x) + 0*x", "numpy.median(x)"])
+def test_evaluate_stream_rejects_reductions(expr):
+    with pytest.raises(ValueError):
+        cal.evaluate_stream(expr, io.StringIO("1\n2\n3\n"), out=io.StringIO())
+    # 交互模式仍然可以使用
+    out = io.StringIO()
+    cal.repl(io.StringIO(f"x = 2.0\n{expr}\n"), out=out)
+    assert "错误" not in out.getvalue()
+
+
+def test_evaluate_stream_rejects_wrong_shape():
+    with pytest.raises(ValueError):
+        cal.evaluate_stream("np.ones_like(x)[..., None] * x", io.StringIO("1\n2\n"), out=io.StringIO())
+    with pytest.raises(ValueError):
+        cal.evaluate_stream("(x, x)", io.StringIO("1\n2\n"), out=io.StringIO())
+
+
+def test_evaluate_stream_independent_of_block_size():
+    text = "".join(f"{v} {v % 7}\n" for v in range(1, 101))
+    outputs = []
+    for block_size in (1, 3, 64, 65536):
+        out = io.StringIO()
+        cal.evaluate_stream("x*2 - hypot(x, y) + where(y > 3, 1, 0)", io.StringIO(text), out=out, block_size=block_size)
+        outputs.append(out.getvalue())
+    assert all(output == outputs[0] for output in outputs)
+
+
+@pytest.mark.parametrize("args", [
+    ["--expr=x*2"],
+    ["--vars", "a", "b", "-e", "a+b"],
+    ["--block", "1", "-e", "a+b", "--vars", "a", "b"],
+])
+def test_stream_mode_options(args):
+    result = subprocess.run([sys.executable, "cal.py", *args], cwd=ROOT, input="1 2\n3 4\n", capture_output=True, text=True, check=True)
+    expected = [2, 6] if args[0] == "--expr=x*2" else [3, 7]
+    assert [float(v) for v in result.stdout.split()] == expected
+
+
+def test_legacy_negative_number():
+    result = subprocess.run([sys.executable, "cal.py", "-1+2"], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.splitlines()[-1].split("=")[-1].strip() == "1"
@@ -0,0 +1,133 @@
+import itertools
+
+import h5py
+import numpy as np
+import pytest
+
+import densityanalysis
+from densityanalysis import StepSource, analyze, analyze_block, spatial_tiles, step_ranges
+from h5delta import write_delta
+from h5layout import write_density
+
+
+@pytest.mark.parametrize("nstep, block, max_steps", [(50, 50, 7), (50, 10, 25), (50, 10, 3), (9, 4, 100), (5, 1, 0)])
+def test_step_ranges_respect_memory(nstep, block, max_steps):
+    step_bytes = 1000
+    ranges = step_ranges(nstep, block, step_bytes, max_steps * step_bytes)
+    assert ranges[0][0] == 0 and ranges[-1][1] == nstep
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert max(stop - start for start, stop in ranges) <= max(max_steps, 1)
+    if max_steps >= block:
+        assert all(start % block == 0 for start, _ in ranges)
+
+
+def write_input(filename, data, layout):
+    with h5py.File(filename, "w") as f:
+        f["lattice_matrix"] = np.diag([2.0, 3.0, 4.0])
+    if layout == "delta":
+        write_delta(filename, "density", data, keyframe_interval=4)
+    else:
+        write_density(filename, "density", data, layout=layout)
+
+
+@pytest.mark.parametrize("layout", ["timeseries", "snapshot", "delta"])
+def test_analyze_in_blocks_under_max_memory(tmp_path, monkeypatch, layout):
+    rng = np.random.default_rng(0)
+    data = rng.random((6, 5, 4, 30))
+    filename = str(tmp_path / "density.hdf5")
+    write_input(filename, data, layout)
+    if layout == "timeseries":
+        with h5py.File(filename, "r") as f:
+            assert f["density"].chunks[-1] == 30
+
+    step_bytes = 6 * 5 * 4 * 8
+    max_memory = 7 * step_bytes
+    sizes = []
+    read = StepSource.read
+
+    def recording_read(self, start, stop, tile=None):
+        block = read(self, start, stop, tile)
+        sizes.append(block.nbytes)
+        return block
+
+    monkeypatch.setattr(densityanalysis.StepSource, "read", recording_read)
+    output = str(tmp_path / "analysis.hdf5")
+    analyze(filename, output, regions=[(0, 0.5, 0, 1, 0, 1)], macro=1.0, max_memory=max_memory)
+
+    assert len(sizes) > 1
+    assert max(sizes) <= max_memory
+    dV = 24.0 / (6 * 5 * 4)
+    with h5py.File(output, "r") as f:
+        np.testing.assert_allclose(f["planar_x"][()], data.mean(axis=(1, 2)).T)
+        np.testing.assert_allclose(f["planar_z"][()], data.mean(axis=(0, 1)).T)
+        np.testing.assert_allclose(f["total"][()], data.sum(axis=(0, 1, 2)) * dV)
+        np.testing.assert_allclose(f["regions"][:, 0], data[:3].sum(axis=(0, 1, 2)) * dV)
+        assert f["macro_x"].shape == (30, 6)
+
+
+def test_workers_match_serial(tmp_path):
+    data = np.random.default_rng(1).random((4, 4, 4, 12))
+    filename = str(tmp_path / "density.hdf5")
+    write_input(filename, data, "balanced")
+    results = []
+    for workers in (1, 2):
+        output = str(tmp_path / f"analysis{workers}.hdf5")
+        analyze(filename, output, axes=["y"], workers=workers, max_memory=3 * 4 * 4 * 4 * 8)
+        with h5py.File(output, "r") as f:
+            results.append(f["planar_y"][()])
+    np.testing.assert_allclose(results[0], results[1])
+
+
+@pytest.mark.parametrize("grid, chunks, nstep, max_voxels", [
+    ((20, 20, 20), (6, 6, 6), 10, 6 * 6 * 20),
+    ((20, 20, 20), (6, 6, 6), 10, 1),
+    ((7, 5, 3), (2, 5, 3), 4, 2 * 5 * 3 * 2),
+    ((8, 8, 8), (8, 8, 8), 2, 10 ** 6),
+])
+def test_spatial_tiles_cover_each_chunk_once(grid, chunks, nstep, max_voxels):
+    tiles = spatial_tiles(grid, chunks, nstep, 8, max_voxels * nstep * 8)
+    covered = np.zeros(grid, dtype=int)
+    for tile in tiles:
+        covered[tile] += 1
+        assert all(s.start % c == 0 and (s.stop % c == 0 or s.stop == n) for s, c, n in zip(tile, chunks, grid))
+        assert np.prod([s.stop - s.start for s in tile]) <= max(max_voxels, np.prod(chunks))
+    assert (covered == 1).all()
+
+
+def test_timeseries_layout_reads_each_chunk_once(tmp_path, monkeypatch):
+    rng = np.random.default_rng(2)
+    data = rng.random((24, 20, 16, 40))
+    filename = str(tmp_path / "density.hdf5")
+    write_input(filename, data, "timeseries")
+    with h5py.File(filename, "r") as f:
+        chunks = f["density"].chunks
+    assert chunks[-1] == 40 and chunks[:3] != data.shape[:3]
+
+    reads = []
+    read = StepSource.read
+
+    def recording_read(self, start, stop, tile=None):
+        block = read(self, start, stop, tile)
+        reads.append((start, stop, tile, block.nbytes))
+        return block
+
+    monkeypatch.setattr(densityanalysis.StepSource, "read", recording_read)
+    max_memory = 10 * 24 * 20 * 16 * 8
+    output = str(tmp_path / "analysis.hdf5")
+    analyze(filename, output, regions=[(0.1, 0.6, 0, 0.5, 0.3, 1)], max_memory=max_memory)
+
+    # 每次读取不超过 max_memory，且每个分块只被读取一次：读取的总字节数等于数据大小
+    assert len(reads) > 1
+    assert max(nbytes for *_, nbytes in reads) <= max_memory
+    assert sum(nbytes for *_, nbytes in reads) == data.nbytes
+    counts = {}
+    for start, stop, tile, _ in reads:
+        ranges = [range(s.start // c, -(-s.stop // c)) for s, c in zip(tile, chunks)]
+        for index in itertools.product(*ranges, range(start // chunks[-1], -(-stop // chunks[-1]))):
+            counts[index] = counts.get(index, 0) + 1
+    assert set(counts.values()) == {1}
+
+    expected = analyze_block(data, ["x", "y", "z"], 24.0 / data[..., 0].size, [densityanalysis.region_slices((0.1, 0.6, 0, 0.5, 0.3, 1), data.shape[:3])], {})
+    with h5py.File(output, "r") as f:
+        for name, value in expected.items():
+            np.testing.assert_allclose(f[name][()], value)
@@ -0,0 +1,114 @@
+import itertools
+
+import freegpu
+
+
+def test_parse_memory_line_na():
+    count, gpu_id, info = freegpu.parse_memory_line("2, 1, [N/A], [N/A], [N/A]")
+    assert (count, gpu_id) == (2, 1)
+    assert info["available"] is False
+    count, gpu_id, info = freegpu.parse_memory_line("2, 0, 24576, 1000, 23576")
+    assert info == {"total": 24576, "used": 1000, "free": 23576, "available": True}
+
+
+def test_one_shot_query(fake_nvidia_smi):
+    fake_nvidia_smi(["2, 0, 24576, 1000, 23576", "2, 1, 24576, 500, 24076"])
+    output, best = freegpu.get_best_gpu()
+    assert best == 1
+    assert len(freegpu.get_nvidia_smi_memory()) == 2
+
+
+def test_stream_yields_samples(fake_nvidia_smi):
+    fake_nvidia_smi(["2, 0, 24576, 1000, 23576", "2, 1, 24576, 500, 24076"])
+    with freegpu.NvidiaSmiStream(interval_ms=50) as stream:
+        samples = list(itertools.islice(stream, 3))
+    assert all(sorted(sample) == [0, 1] for sample in samples)
+
+
+def test_stream_with_unavailable_gpu(fake_nvidia_smi):
+    # MIG 等设备显存为 [N/A]，采样仍需按轮输出，且该 GPU 不参与选卡
+    fake_nvidia_smi(["2, 0, [N/A], [N/A], [N/A]", "2, 1, 24576, 500, 24076"])
+    with freegpu.NvidiaSmiStream(interval_ms=50) as stream:
+        sample = next(iter(stream))
+    assert sample[0]["available"] is False
+    output, best = freegpu.get_best_gpu(memory_info=sample)
+    assert best == 1
+    assert "N/A" in output
+
+
+def test_stream_emits_on_repeated_index(fake_nvidia_smi):
+    # count 与实际行数不一致时，以索引重复作为一轮采样的边界
+    fake_nvidia_smi(["3, 0, 100, 10, 90", "3, 1, 100, 20, 80"])
+    with freegpu.NvidiaSmiStream(interval_ms=50) as stream:
+        samples = list(itertools.islice(stream, 2))
+    assert all(sorted(sample) == [0, 1] for sample in samples)
+
+
+def _history(samples):
+    history = freegpu.MemoryHistory(window=5)
+    for sample in samples:
+        history.update(sample)
+    return history
+
+
+def test_memory_history_uses_peak():
+    history = _history([
+        {0: {"total": 100, "used": 80, "free": 20}},
+        {0: {"total": 100, "used": 10, "free": 90}},
+    ])
+    assert history.effective_free(0) == 20
+    assert freegpu.pick_gpu(history, 50) is None
+
+
+def test_parse_memory_size():
+    assert freegpu.parse_memory_size("20G") == 20 * 1024
+    assert freegpu.parse_memory_size("512MiB") == 512
+    assert freegpu.parse_memory_size("1000") == 1000
+
+
+def test_plan_gpu_not_blocked_by_unplaceable_head():
+    history = _history([{
+        0: {"total": 100, "used": 90, "free": 10},
+        1: {"total": 100, "used": 0, "free": 100},
+    }])
+    # 前面的任务限定在忙碌的 GPU 0 或要求过大，不应阻塞后面的任务
+    assert freegpu.plan_gpu(history, 50, ahead=[(50, [0]), (1000, None)]) == 1
+
+
+def test_plan_gpu_blocked_head_is_not_starved():
+    # GPU 0 空闲 30G，排在最前的任务需要 40G；后面源源不断的 20G 任务不能抢走 GPU 0 上释放出的显存
+    samples = [{0: {"total": 48, "used": 18, "free": 30}, 1: {"total": 48, "used": 23, "free": 25}}]
+    history = _history(samples)
+    head = [(40, None)]
+    # 头部任务在最接近满足的 GPU 0 上预留，小任务只能用 GPU 1
+    assert freegpu.plan_gpu(history, 20, ahead=head) == 1
+    assert freegpu.plan_gpu(history, 20, ahead=head + [(20, None)]) is None
+    # GPU 0 释放显存后头部任务可以启动，小任务仍只能使用超出预留的部分
+    history = _history(samples + [{0: {"total": 48, "used": 5, "free": 43}, 1: samples[0][1]}] * 30)
+    assert freegpu.plan_gpu(history, 40) == 0
+    assert freegpu.plan_gpu(history, 20, ahead=[(40, [1])]) == 0
+    assert freegpu.closest_gpu(history, 40, gpus=[1]) == 1
+    assert freegpu.closest_gpu(history, 100) is None
+
+
+def test_plan_gpu_respects_jobs_ahead():
+    history = _history([{
+        0: {"total": 100, "used": 90, "free": 10},
+        1: {"total": 100, "used": 0, "free": 100},
+    }])
+    # 前面的任务能放到 GPU 1，它先占用，后面的任务需继续等待
+    assert freegpu.plan_gpu(history, 60, ahead=[(60, None)]) is None
+    assert freegpu.plan_gpu(history, 40, ahead=[(60, None)]) == 1
+
+
+def test_wait_for_gpu_skips_blocked_head(fake_nvidia_smi, tmp_path):
+    import os
+    fake_nvidia_smi(["2, 0, 100, 90, 10", "2, 1, 100, 0, 100"])
+    lock_dir = str(tmp_path / "locks")
+    leases = freegpu.GpuLeases(lock_dir)
+    # 伪造一个排在最前、只能用 GPU 0 的存活任务（用父进程 pid）
+    with open(os.path.join(leases.queue_dir, f"{0:020d}.{os.getppid()}"), "w") as f:
+        f.write("50 0\n")
+    gpu_id = freegpu.wait_for_gpu(50, interval=0.05, window=3, lock_dir=lock_dir)
+    assert gpu_id == 1
+    assert os.listdir(leases.lease_dir) == [f"gpu1.{os.getpid()}"]
@@ -0,0 +1,87 @@
+import h5py
+import numpy as np
+import pytest
+
+from h5delta import DeltaReader, is_delta, read_steps, write_delta
+
+
+@pytest.fixture
+def trajectory():
+    rng = np.random.default_rng(0)
+    base = rng.random((4, 3, 2, 1))
+    return base + 1e-3 * np.cumsum(rng.standard_normal((4, 3, 2, 11)), axis=-1)
+
+
+@pytest.mark.parametrize("keyframe_interval", [1, 3, 11, 20])
+def test_lossless_round_trip(tmp_path, trajectory, keyframe_interval):
+    filename = str(tmp_path / "d.hdf5")
+    write_delta(filename, "density", trajectory, keyframe_interval=keyframe_interval)
+    np.testing.assert_array_equal(read_steps(filename, "density"), trajectory)
+    np.testing.assert_array_equal(read_steps(filename, "density", 4, 9), trajectory[..., 4:9])
+
+
+def test_quantized_error_is_bounded(tmp_path, trajectory):
+    filename = str(tmp_path / "d.hdf5")
+    write_delta(filename, "density", trajectory, keyframe_interval=4, tolerance=1e-4)
+    with h5py.File(filename, "r") as f:
+        assert is_delta(f["density"])
+        reader = DeltaReader(f["density"])
+        assert np.abs(reader[:] - trajectory).max() <= 1e-4 * (1 + 1e-9)
+        np.testing.assert_allclose(reader[-1], trajectory[..., -1], atol=1e-4)
+
+
+@pytest.mark.parametrize("options", [
+    dict(keyframe_interval=0),
+    dict(keyframe_interval=-2),
+    dict(tolerance=0.0),
+    dict(tolerance=-1e-3),
+    dict(tolerance=float("nan")),
+])
+def test_invalid_arguments(tmp_path, trajectory, options):
+    filename = tmp_path / "d.hdf5"
+    with pytest.raises(ValueError):
+        write_delta(str(filename), "density", trajectory, **options)
+    assert not filename.exists()
+
+
+def test_survives_compress_hdf5(tmp_path, trajectory):
+    from compress_hdf5 import compress_hdf5
+    from densityanalysis import StepSource
+
+    original = str(tmp_path / "d.hdf5")
+    compressed = str(tmp_path / "c.hdf5")
+    with h5py.File(original, "w") as f:
+        f["lattice_matrix"] = np.eye(3)
+    write_delta(original, "density", trajectory, keyframe_interval=4, tolerance=1e-4)
+    compress_hdf5(original, compressed, 4)
+    np.testing.assert_array_equal(read_steps(compressed, "density"), read_steps(original, "density"))
+    source = StepSource(compressed)
+    try:
+        assert source.block == 4 and source.shape == trajectory.shape
+    finally:
+        source.close()
+
+
+def test_step_source_rejects_plain_group(tmp_path):
+    from densityanalysis import StepSource
+
+    filename = str(tmp_path / "d.hdf5")
+    with h5py.File(filename, "w") as f:
+        f.create_group("density")["keyframes"] = np.zeros((2, 2, 2, 1))
+    with pytest.raises(ValueError, match="h5delta"):
+        StepSource(filename)
+
+
+@pytest.mark.parametrize("tolerance", [1e-6, 1e-5, 1e-3])
+def test_quantized_error_bound_holds_for_float32(tmp_path, trajectory, tolerance):
+    filename = str(tmp_path / "d.hdf5")
+    data = (trajectory * 3).astype(np.float32)
+    write_delta(filename, "density", data, keyframe_interval=5, tolerance=tolerance)
+    restored = read_steps(filename, "density")
+    assert restored.dtype == np.float32
+    assert np.abs(restored.astype(np.float64) - data.astype(np.float64)).max() <= tolerance
+
+
+def test_tolerance_below_storage_precision(tmp_path, trajectory):
+    with pytest.raises(ValueError):
+        write_delta(str(tmp_path / "d.hdf5"), "density", (trajectory * 1e3).astype(np.float32), tolerance=1e-6)
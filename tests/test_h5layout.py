@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+import h5layout
+from h5layout import choose_chunks, chunk_cache_size, open_density, write_density
+
+MB = 1024 ** 2
+
+
+def test_cache_follows_access_pattern():
+    shape = (200, 200, 200, 1000)
+    chunks = choose_chunks(shape, 8, "timeseries")
+    chunk_bytes = np.prod(chunks) * 8
+    # 读单个格点的时间序列只涉及一块，不需要为整个快照分配 cache
+    nbytes, _ = chunk_cache_size(shape, chunks, 8, "timeseries")
+    assert nbytes == chunk_bytes
+    nbytes, _ = chunk_cache_size(shape, chunks, 8, "snapshot")
+    assert nbytes == h5layout.MAX_CACHE_BYTES
+    nbytes, _ = chunk_cache_size(shape, chunks, 8, "snapshot", max_bytes=64 * MB)
+    assert nbytes == 64 * MB
+
+    chunks = choose_chunks(shape, 8, "snapshot")
+    nbytes, _ = chunk_cache_size(shape, chunks, 8, "snapshot")
+    assert nbytes == np.prod(chunks) * 8
+    with pytest.raises(ValueError):
+        chunk_cache_size(shape, chunks, 8, "random")
+
+
+@pytest.mark.parametrize("access", [None, "snapshot", "timeseries"])
+def test_open_density(tmp_path, access):
+    filename = str(tmp_path / "d.hdf5")
+    data = np.random.default_rng(0).random((6, 5, 4, 7))
+    write_density(filename, "density", data, layout="balanced", dtype="float32")
+    f, dset = open_density(filename, "density", access=access)
+    try:
+        assert dset.attrs["layout"] == "balanced"
+        np.testing.assert_array_equal(dset[...], data.astype(np.float32))
+        nbytes = dset.id.get_access_plist().get_chunk_cache()[1]
+        if access is None:
+            assert nbytes == f.id.get_access_plist().get_cache()[2]
+        else:
+            assert nbytes == chunk_cache_size(dset.shape, dset.chunks, 4, access)[0]
+    finally:
+        f.close()
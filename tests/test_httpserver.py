@@ -0,0 +1,130 @@
+import functools
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import httpserver
+from httpserver import DirectoryListingCache, RangeRequestHandler
+
+
+@pytest.fixture
+def serve(tmp_path):
+    """在回环地址的随机端口上共享 tmp_path，返回 GET 函数"""
+    handler = functools.partial(RangeRequestHandler, directory=str(tmp_path))
+    server = httpserver.HTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def get(path, headers=None):
+        with urllib.request.urlopen(urllib.request.Request(base + path, headers=headers or {})) as response:
+            return response.status, response.headers, response.read()
+
+    yield get
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def tree(tmp_path):
+    names = ["Readme.txt", "readme.md", "data_1.bin", "data_2.bin", "Data_3.bin", "notes.txt"]
+    for i, name in enumerate(names):
+        (tmp_path / name).write_bytes(b"x" * i)
+    (tmp_path / "data_dir").mkdir()
+    return tmp_path
+
+
+def listing(get, query):
+    status, headers, body = get(f"/?format=json&{query}")
+    assert status == 200
+    assert headers["Content-Type"].startswith("application/json")
+    return json.loads(body)
+
+
+def test_json_schema(serve, tree):
+    result = listing(serve, "")
+    assert set(result) == {"path", "prefix", "page", "per_page", "pages", "total", "entries"}
+    assert result["path"] == "/" and result["total"] == 7 and result["pages"] == 1
+    names = [e["name"] for e in result["entries"]]
+    assert names == sorted(names, key=str.lower)
+    entry = next(e for e in result["entries"] if e["name"] == "notes.txt")
+    assert entry == {"name": "notes.txt", "is_dir": False, "size": 5, "mtime": os.stat(tree / "notes.txt").st_mtime}
+    assert next(e for e in result["entries"] if e["name"] == "data_dir")["is_dir"] is True
+
+
+def test_prefix_is_case_insensitive(serve, tree):
+    assert {e["name"] for e in listing(serve, "prefix=re")["entries"]} == {"Readme.txt", "readme.md"}
+    assert {e["name"] for e in listing(serve, "prefix=DATA_")["entries"]} == {"data_1.bin", "data_2.bin", "Data_3.bin", "data_dir"}
+    assert listing(serve, "prefix=zzz")["total"] == 0
+
+
+def test_pagination(serve, tree):
+    pages = [listing(serve, f"per_page=3&page={n}") for n in (1, 2, 3)]
+    assert [p["pages"] for p in pages] == [3, 3, 3]
+    assert [len(p["entries"]) for p in pages] == [3, 3, 1]
+    names = [e["name"] for p in pages for e in p["entries"]]
+    assert names == [e["name"] for e in listing(serve, "")["entries"]]
+    # 超过总页数时返回空列表
+    beyond = listing(serve, "per_page=3&page=9")
+    assert beyond["entries"] == [] and beyond["page"] == 9 and beyond["total"] == 7
+    # 过滤后的分页
+    filtered = listing(serve, "prefix=data&per_page=3&page=2")
+    assert (filtered["total"], filtered["pages"], len(filtered["entries"])) == (4, 2, 1)
+
+
+def test_html_listing(serve, tree):
+    status, headers, body = serve("/?prefix=re&per_page=1")
+    assert status == 200 and headers["Content-Type"].startswith("text/html")
+    text = body.decode()
+    assert "2 entries, page 1/2" in text and "next &raquo;" in text and "prev" not in text
+    assert 'href="readme.md"' in text
+
+
+@pytest.mark.parametrize("query", ["page=abc", "page=0", "per_page=-1", "per_page=x"])
+def test_bad_page_is_400(serve, tree, query):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        serve(f"/?{query}")
+    assert error.value.code == 400
+
+
+def test_range_request(serve, tree):
+    status, headers, body = serve("/notes.txt", headers={"Range": "bytes=1-3"})
+    assert status == 206 and body == b"xxx"
+    assert headers["Content-Range"] == "bytes 1-3/5"
+
+
+def test_cache_rebuilds_on_mtime_and_ttl(tmp_path, monkeypatch):
+    scans = []
+    scan = DirectoryListingCache._scan
+    monkeypatch.setattr(DirectoryListingCache, "_scan", staticmethod(lambda path: scans.append(path) or scan(path)))
+    clock = [100.0]
+    monkeypatch.setattr(httpserver.time, "monotonic", lambda: clock[0])
+
+    cache = DirectoryListingCache(max_dirs=2, ttl=10)
+    (tmp_path / "a").write_text("1")
+    keys, entries = cache.get(str(tmp_path))
+    assert keys == ["a"] and len(scans) == 1
+    cache.get(str(tmp_path))
+    assert len(scans) == 1
+
+    # 新增条目改变目录 mtime，立即重建
+    (tmp_path / "B").write_text("22")
+    os.utime(tmp_path, ns=(0, os.stat(tmp_path).st_mtime_ns + 10 ** 9))
+    keys, entries = cache.get(str(tmp_path))
+    assert keys == ["a", "b"] and len(scans) == 2
+
+    # 文件大小变化不改变目录 mtime，ttl 过期后才重建
+    (tmp_path / "a").write_text("longer")
+    assert cache.get(str(tmp_path))[1][0][2] == 1
+    clock[0] += 11
+    assert cache.get(str(tmp_path))[1][0][2] == 6 and len(scans) == 3
+
+    # 超过 max_dirs 时淘汰最久未用的目录
+    for name in ("x", "y"):
+        (tmp_path / name).mkdir(exist_ok=True)
+        cache.get(str(tmp_path / name))
+    assert str(tmp_path) not in cache._cache and len(cache._cache) == 2
@@ -0,0 +1,64 @@
+import gc
+
+import h5py
+import numpy as np
+import pytest
+
+from lazyhdf5 import LazyDataset, load_lazy, materialize, release
+
+
+@pytest.fixture
+def h5file(tmp_path):
+    filename = tmp_path / "density.hdf5"
+    with h5py.File(filename, "w") as f:
+        f["plot"] = np.arange(24.0).reshape(2, 3, 4)
+        f.create_dataset("packed", data=np.ones((10, 10)), chunks=(5, 5), compression="gzip")
+        f["grid/nr1x"] = 2
+        f["title"] = b"abc"
+    return str(filename)
+
+
+def test_contiguous_dataset_is_memmap(h5file):
+    with load_lazy(h5file) as data:
+        assert isinstance(data["plot"], LazyDataset)
+        assert data["plot"].mappable
+        view = data["plot"][1]
+        assert isinstance(view, np.memmap)
+        assert np.array_equal(view, np.arange(12.0, 24.0).reshape(3, 4))
+        assert data["plot"][..., np.newaxis].shape == (2, 3, 4, 1)
+
+
+def test_chunked_dataset_and_scalars(h5file):
+    with load_lazy(h5file) as data:
+        assert not data["packed"].mappable
+        assert data["packed"][1:3, ::-1].shape == (2, 10)
+        assert np.asarray(data["packed"]).sum() == 100
+        assert data["grid"]["nr1x"] == 2
+        assert data["title"] == "abc"
+
+
+def test_materialize_detaches_from_file(h5file):
+    data = load_lazy(h5file)
+    plain = materialize(data)
+    release(data)
+    assert type(plain["plot"]) is np.ndarray
+    assert plain["plot"].sum() == sum(range(24))
+
+
+def test_refcounted_lifetime(h5file):
+    data = load_lazy(h5file)
+    packed = data["packed"]
+    ref = packed._ref
+    data.close()
+    # 代理仍被持有时文件保持打开
+    assert not ref.closed
+    assert packed[0, 0] == 1.0
+    packed.close()
+    gc.collect()
+    assert ref.closed
+    with pytest.raises(ValueError):
+        packed[0]
+
+
+def test_release_ignores_plain_dict():
+    release({"plot": np.zeros(3)})
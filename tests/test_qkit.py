@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import qkit
+from conftest import ROOT
+
+HEAVY_MODULES = ("numpy", "h5py", "torch", "psutil", "qakits")
+
+
+def imported_modules(args):
+    """用 -X importtime 运行 qkit.py，返回导入过的顶层模块名"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.join(ROOT, "qkit.py")] + args,
+        capture_output=True, text=True, check=True,
+    )
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            name = line.rsplit("|", 1)[-1].strip()
+            modules.add(name.split(".")[0])
+    return result.stdout, modules
+
+
+def test_hash_does_not_import_heavy_modules(tmp_path):
+    target = tmp_path / "file.bin"
+    target.write_bytes(b"qkit")
+    stdout, modules = imported_modules(["hash", str(target)])
+    assert "MD5" in stdout
+    assert "hashlib" in modules
+    assert not modules & set(HEAVY_MODULES)
+
+
+@pytest.mark.parametrize("args", [["calc", "1+2"], ["--help"]])
+def test_light_commands_do_not_import_numpy(args):
+    _, modules = imported_modules(args)
+    assert not modules & set(HEAVY_MODULES)
+
+
+def test_all_subcommands_resolve():
+    for name, (module_name, _) in qkit.SUBCOMMANDS.items():
+        assert os.path.exists(os.path.join(ROOT, f"{module_name}.py")), name
+    assert qkit.SUBCOMMANDS["analyze"][0] == "densityanalysis"
+
+
+def test_unknown_subcommand():
+    assert qkit.main(["nope"]) == 2
+
+
+def test_executable_via_symlink(tmp_path):
+    link = tmp_path / "qkit"
+    link.symlink_to(os.path.join(ROOT, "qkit.py"))
+    result = subprocess.run([str(link), "calc", "2**10"], capture_output=True, text=True, check=True)
+    assert result.stdout.split()[-1] == "1024"